@@ -4,6 +4,7 @@ from bson import ObjectId
 from db import db
 from datetime import datetime, timedelta
 import re
+from customer_dashboard import invalidate_dashboard_services
 
 admin_afa_bp = Blueprint("admin_afa", __name__)
 
@@ -205,6 +206,7 @@ def admin_afa_set_settings():
                 }
             },
         )
+        invalidate_dashboard_services()
     except Exception:
         pass
 
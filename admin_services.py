@@ -9,12 +9,21 @@ import uuid
 import re
 from ast import literal_eval
 from collections import defaultdict
+from customer_dashboard import invalidate_customer_profit_overrides, invalidate_dashboard_services
 
 admin_services_bp = Blueprint("admin_services", __name__)
 services_col = db["services"]
 users_col = db["users"]                     # customers live here
 service_profits_col = db["service_profits"] # {service_id, customer_id, profit_percent, created_at, updated_at}
 
+# ---- Optional indexes (run once on import) ----
+try:
+    # per-service override listing/cleanup; the dashboard's (customer_id, service_id) index can't serve these
+    service_profits_col.create_index([("service_id", 1), ("customer_id", 1)])
+except Exception:
+    # Index creation failures shouldn't crash the app
+    pass
+
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
 UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
 
@@ -99,7 +108,7 @@ def _format_volume(vol_mb):
         return "-"
     if vol_mb >= 1000:
         gb = vol_mb / 1000.0
-        return f"{int(gb)}GB" if abs(gb - round(gb)) < 1e-9 else f"{gb:.2f}GB"
+        return f"{int(gb)}GB" if gb.is_integer() else f"{gb:.2f}GB"
     return f"{int(vol_mb)}MB"
 
 def _extract_pkg_id(value_raw):
@@ -345,6 +354,7 @@ def create_service():
     }
 
     services_col.insert_one(doc)
+    invalidate_dashboard_services()
     flash("Service added successfully.", "success")
     return redirect(url_for("admin_services.manage_services"))
 
@@ -393,6 +403,7 @@ def update_service(service_id):
         update_doc["type"] = service_type
 
     services_col.update_one({"_id": _id}, {"$set": update_doc})
+    invalidate_dashboard_services()
     flash("Service updated successfully.", "success")
     return redirect(url_for("admin_services.manage_services"))
 
@@ -409,6 +420,7 @@ def delete_service(service_id):
 
     svc = services_col.find_one({"_id": _id})
     res = services_col.delete_one({"_id": _id})
+    invalidate_dashboard_services()
 
     if res.deleted_count:
         try:
@@ -475,6 +487,7 @@ def set_service_default_profit(service_id):
         "default_profit_percent": float(p),
         "updated_at": datetime.utcnow()
     }})
+    invalidate_dashboard_services()
     flash("Default profit percentage updated.", "success")
     return redirect(url_for("admin_services.manage_services"))
 
@@ -513,6 +526,7 @@ def set_customer_profit_for_service(service_id):
          "$setOnInsert": {"created_at": now}},
         upsert=True
     )
+    invalidate_customer_profit_overrides(c_id)
     flash("Customer profit for service updated.", "success")
     return redirect(url_for("admin_services.manage_services"))
 
@@ -529,6 +543,7 @@ def delete_customer_profit_for_service(service_id, customer_id):
         return redirect(url_for("admin_services.manage_services"))
 
     res = service_profits_col.delete_one({"service_id": s_id, "customer_id": c_id})
+    invalidate_customer_profit_overrides(c_id)
     if res.deleted_count:
         flash("Customer profit override removed.", "info")
     else:
@@ -614,6 +629,7 @@ def set_service_type(service_id):
         {"_id": _id},
         {"$set": {"type": desired, "updated_at": datetime.utcnow()}}
     )
+    invalidate_dashboard_services()
     if not res.matched_count:
         return jsonify({"success": False, "error": "Service not found"}), 404
 
@@ -661,6 +677,7 @@ def set_service_status(service_id):
         {"_id": _id},
         {"$set": {"status": status_val, "updated_at": datetime.utcnow()}}
     )
+    invalidate_dashboard_services()
     if not res.matched_count:
         return jsonify({"success": False, "error": "Service not found"}), 404
 
@@ -688,6 +705,7 @@ def set_service_availability(service_id):
         {"_id": _id},
         {"$set": {"availability": avail_val, "updated_at": datetime.utcnow()}}
     )
+    invalidate_dashboard_services()
     if not res.matched_count:
         return jsonify({"success": False, "error": "Service not found"}), 404
 
@@ -3,6 +3,8 @@ from __future__ import annotations
 import os
 from datetime import datetime, timedelta
 from flask import Flask, send_from_directory, session, request
+from flask.json.provider import DefaultJSONProvider
+import orjson
 
 # Load .env for non-secret things (e.g., Paystack keys)
 try:
@@ -73,8 +75,30 @@ SESSION_REFRESH_EACH_REQUEST = True
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", os.path.join(os.getcwd(), "uploads"))
 
 
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson (jsonify, request.get_json, |tojson).
+    Output matches the default provider: sorted keys, and dates / Decimal / UUID
+    go through Flask's own default() hook (dates stay RFC 822 strings).
+    """
+
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, obj, **kwargs):
+        option = self._OPTIONS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get("default", self.default), option=option).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 def create_app():
     app = Flask(__name__)
+    app.json = OrjsonProvider(app)
 
     # --- Session / cookies (all hard-coded) ---
     app.secret_key = SECRET_KEY
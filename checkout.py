@@ -1,7 +1,15 @@
-from flask import Blueprint, request, jsonify, session, render_template, abort
+from flask import Blueprint, Response, request, jsonify, session, render_template, abort
 from bson import ObjectId
 from datetime import datetime, timedelta
-import os, uuid, random, requests, traceback, json, ast, re, threading
+import os, sys, uuid, random, requests, traceback, json, ast, re, threading, time, hashlib, queue, atexit
+import orjson
+from functools import lru_cache
+from collections import deque
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pymongo import UpdateOne
+from pymongo.write_concern import WriteConcern
 
 from db import db
 
@@ -15,6 +23,21 @@ services_col        = db["services"]
 service_profits_col = db["service_profits"]  # per-customer overrides
 users_col           = db["users"]  # ✅ for invoice view
 
+# ---- Optional indexes (run once on import) ----
+try:
+    # duplicate-in-processing guard: $elemMatch on phone/network/amount within processing orders
+    orders_col.create_index(
+        [("items.phone", 1), ("items.network_id", 1), ("items.amount", 1), ("status", 1), ("created_at", 1)],
+        name="dup_skip_idx",
+    )
+    orders_col.create_index([("user_id", 1), ("order_lookup_keys", 1)])
+except Exception:
+    # Index creation failures shouldn't crash the app
+    pass
+
+# Unacknowledged handle for debug-only telemetry writes (nothing reads them back in-request)
+_orders_fast = orders_col.with_options(write_concern=WriteConcern(w=0))
+
 
 # ===== DataConnect Provider Config (replaces old DataVerse) ===================
 DATACONNECT_BASE_URL = "https://dataconnectgh.com/api/v1"
@@ -22,6 +45,11 @@ DATACONNECT_API_KEY = os.getenv(
     "DATACONNECT_API_KEY",
     "90bcf2f236b8c95547b58b531f5c597df8a061a8",  # fallback; you can remove/harden
 )
+DATACONNECT_HEADERS = {
+    "Accept": "application/json",
+    "Content-Type": "application/json",
+    "x-api-key": DATACONNECT_API_KEY,
+}
 
 
 # ===== Portal-02 Provider Config ==============================================
@@ -31,6 +59,11 @@ PORTAL02_WEBHOOK_URL = os.getenv(
     "PORTAL02_WEBHOOK_URL",
     "https://www.portal-02.com/api/webhooks/orders",
 )
+PORTAL02_HEADERS = {
+    "Accept": "application/json",
+    "Content-Type": "application/json",
+    "x-api-key": PORTAL02_API_KEY,
+}
 
 # Default offer slugs (can be overridden per-service or per-item)
 PORTAL02_OFFER_SLUG_MTN_NORMAL = "master_beneficiary_data_bundle"  # MTN normal
@@ -46,12 +79,108 @@ NETWORK_ID_FALLBACK = {
 
 
 # ===== Tiny JSON logger =======================================================
-def jlog(event: str, **kv):
+# 1 = normal; 2 = verbose (request payloads, balances, per-line routing decisions)
+_LOG_LEVEL = int(os.getenv("CKOUT_LOG_LEVEL", "1") or 1)
+_JLOG_VERBOSE = _LOG_LEVEL >= 2  # checked before building verbose records, so disabled ones cost one global load
+
+
+def _jlog_line(event: str, kv: dict) -> bytes:
     rec = {"evt": event, **kv}
     try:
-        print(json.dumps(rec, ensure_ascii=False, separators=(",", ":")))
+        # default=str covers ObjectId & friends; datetimes are encoded natively
+        return orjson.dumps(rec, default=str, option=orjson.OPT_NON_STR_KEYS)
+    except Exception:
+        pass
+    try:
+        # e.g. ints beyond 64 bits, which orjson refuses
+        return json.dumps(rec, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
     except Exception:
-        print(f"[LOG_FALLBACK] {event} {kv}")
+        return f"[LOG_FALLBACK] {event} {kv}".encode("utf-8", "replace")
+
+
+def _log_write(data: bytes, flush: bool = False):
+    out = getattr(sys.stdout, "buffer", None)
+    if out is None:  # stdout replaced by a text-only stream
+        print(data.decode("utf-8", "replace"), end="", flush=flush)
+        return
+    out.write(data)
+    if flush:
+        out.flush()
+
+
+def jlog(event: str, **kv):
+    _log_write(_jlog_line(event, kv) + b"\n")
+
+
+# ===== Background log writer ==================================================
+# jlog_async() only enqueues; formatting/printing happens on a daemon thread so
+# request threads never block on log output. On overflow the record is dropped.
+# The writer drains whatever is queued (up to LOG_BATCH_MAX) into a single write.
+_LOG_QUEUE = queue.Queue(maxsize=10000)
+_LOG_DROPPED = 0
+LOG_BATCH_MAX = 200
+
+
+def _log_writer():
+    while True:
+        batch = [_LOG_QUEUE.get()]
+        try:
+            while len(batch) < LOG_BATCH_MAX:
+                batch.append(_LOG_QUEUE.get_nowait())
+        except queue.Empty:
+            pass
+
+        lines = []
+        for event, kv, exc in batch:
+            if exc is not None:
+                kv["error"] = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            lines.append(_jlog_line(event, kv))
+        try:
+            _log_write(b"\n".join(lines) + b"\n", flush=True)
+        except Exception:
+            pass
+
+
+threading.Thread(target=_log_writer, name="checkout-log", daemon=True).start()
+
+
+def jlog_async(event: str, _exc: BaseException | None = None, **kv):
+    global _LOG_DROPPED
+    try:
+        _LOG_QUEUE.put_nowait((event, kv, _exc))
+    except queue.Full:
+        _LOG_DROPPED += 1
+
+
+# Repeated identical exceptions (same type + raising line) are logged once per
+# window; repeats inside the window are only sampled and otherwise counted.
+UNCAUGHT_LOG_WINDOW_SECS = 60
+UNCAUGHT_LOG_SAMPLE_RATE = 0.01
+_uncaught_seen = {}  # fingerprint -> (window_start, suppressed_count)
+
+
+def _log_uncaught(event: str, exc: BaseException):
+    tb = exc.__traceback__
+    while tb is not None and tb.tb_next is not None:
+        tb = tb.tb_next
+    fp = (type(exc).__name__, tb.tb_frame.f_code.co_filename, tb.tb_lineno) if tb else (type(exc).__name__,)
+
+    now = time.monotonic()
+    seen = _uncaught_seen.get(fp)
+    if seen is None:
+        # first occurrence of this fingerprint is always logged and opens its window
+        _uncaught_seen[fp] = (now, 0)
+        jlog_async(event, _exc=exc)
+        return
+
+    window_start, suppressed = seen
+    if now - window_start >= UNCAUGHT_LOG_WINDOW_SECS:
+        _uncaught_seen[fp] = (now, 0)
+        jlog_async(event, _exc=exc, suppressed_since_last=suppressed)
+    elif random.random() < UNCAUGHT_LOG_SAMPLE_RATE:
+        jlog_async(event, _exc=exc, sampled=True)
+    else:
+        _uncaught_seen[fp] = (window_start, suppressed + 1)
 
 
 # ===== Helpers ================================================================
@@ -59,6 +188,12 @@ def generate_order_id():
     return f"NAN{random.randint(10000, 99999)}"
 
 
+@lru_cache(maxsize=512)
+def _oid(s: str) -> ObjectId:
+    """ObjectId(s), parsed once per distinct id string; raises like ObjectId on bad input."""
+    return ObjectId(s)
+
+
 def _money(v):
     try:
         return float(v)
@@ -111,36 +246,6 @@ def _effective_profit_percent(service_doc, customer_id_obj):
     return override if override is not None else _get_service_default_profit_percent(service_doc)
 
 
-def _pick_offer_base_amount_from_service(svc_doc, value_obj, raw_value):
-    """
-    Try to recover the base (wholesale) amount from the selected offer in svc_doc.offers.
-    """
-    try:
-        offers = svc_doc.get("offers") or []
-        vid = (value_obj or {}).get("id")
-        vvol = (value_obj or {}).get("volume")
-        for of in offers:
-            of_val = of.get("value")
-            of_amt = _to_float(of.get("amount"))
-            if isinstance(of_val, str) and of_val.strip().startswith("{") and of_val.strip().endswith("}"):
-                try:
-                    of_val = json.loads(of_val)
-                except Exception:
-                    try:
-                        of_val = ast.literal_eval(of_val)
-                    except Exception:
-                        pass
-            if isinstance(of_val, dict):
-                if (vid is not None and of_val.get("id") == vid) or (vvol is not None and of_val.get("volume") == vvol):
-                    return of_amt
-            else:
-                if raw_value is not None and of_val == raw_value:
-                    return of_amt
-    except Exception:
-        pass
-    return None
-
-
 def _derive_base_profit(amount_total, base_amount_hint, eff_percent):
     a = _money(amount_total)
     if a <= 0:
@@ -165,6 +270,22 @@ def _derive_base_profit(amount_total, base_amount_hint, eff_percent):
 
 
 # ===== Field resolvers =======================================================
+_RE_GB = re.compile(r"(\d+(?:\.\d+)?)\s*gb", re.IGNORECASE)
+_RE_NUM = re.compile(r"(\d+(?:\.\d+)?)")
+_RE_NON_DIGIT = re.compile(r"\D")
+_RE_ISHARE = re.compile(r"i[\s-]?share")
+# groups: 1 = MTN, 2 = Telecel (ex-Vodafone), 3 = AirtelTigo / iShare
+_RE_NETWORK = re.compile(r"(mtn)|(telecel|vodafone)|(airtel[ -]?tigo|i ?share)", re.IGNORECASE)
+_NETWORK_SLUG_DIRECT = {
+    "mtn": "mtn",
+    "telecel": "telecel",
+    "vodafone": "telecel",
+    "airteltigo": "airteltigo",
+    "at": "airteltigo",
+    "ishare": "airteltigo",
+}
+
+
 def _resolve_network_id(item: dict, value_obj: dict, svc_doc: dict | None):
     """
     Internal numeric network ID, used only for duplicate guards / reporting.
@@ -202,6 +323,13 @@ def _resolve_dataconnect_network(svc_doc: dict | None, item: dict) -> str | None
     """
     doc = svc_doc
 
+    # Fast path: service_network already holds a known slug
+    sn = (doc or {}).get("service_network")
+    if isinstance(sn, str):
+        direct = _NETWORK_SLUG_DIRECT.get(sn.strip().lower())
+        if direct:
+            return direct
+
     # Fallback: look up by service name if svc_doc is missing
     if not doc:
         sname = (item.get("serviceName") or "").strip()
@@ -224,29 +352,55 @@ def _resolve_dataconnect_network(svc_doc: dict | None, item: dict) -> str | None
     candidates.append(item.get("network_name"))
     candidates.append(item.get("serviceName"))
 
-    joined = " ".join(str(c) for c in candidates if c).lower()
+    return _network_slug_from_names(tuple(str(c) for c in candidates if c))
 
-    if "mtn" in joined:
-        return "mtn"
+
+@lru_cache(maxsize=256)
+def _network_slug_from_names(names: tuple) -> str | None:
+    """
+    Cached keyword scan behind _resolve_dataconnect_network; carts repeat the same
+    service/network names, so each distinct combination is scanned once.
+    """
+    hits = set()
+    for m in _RE_NETWORK.finditer(" ".join(names)):
+        if m.lastindex == 1:
+            return "mtn"
+        hits.add(m.lastindex)
 
     # Telecel / Vodafone rebrand
-    if "telecel" in joined or "vodafone" in joined:
+    if 2 in hits:
         return "telecel"
 
     # AirtelTigo / AT / iShare
-    if (
-        "airteltigo" in joined
-        or "airtel tigo" in joined
-        or "airtel-tigo" in joined
-        or "at - ishare" in joined
-        or "i share" in joined
-        or "ishare" in joined
-    ):
+    if 3 in hits:
         return "airteltigo"
 
     return None
 
 
+# resolved network -> (index of the _classify_service flag that must be set, Portal-02 network slug)
+_PORTAL02_TABLE = {
+    "mtn": (1, "mtn"),                # MTN Normal
+    "telecel": (2, "telecel"),        # Telecel bundle
+    "airteltigo": (3, "airteltigo"),  # AirtelTigo iShare
+}
+
+
+def _classify_service(svc_doc: dict, svc_name: str | None) -> tuple:
+    """
+    Routing flags for a service line:
+    (is_mtn_express, is_mtn_normal, is_telecel_bundle, is_ishare_bundle)
+    """
+    svc_name_norm = (svc_name or "").strip().lower()
+    combo_name_net = f"{svc_name_norm} {svc_doc['_network_l']}"
+    return (
+        svc_name_norm == "mtn express",
+        svc_name_norm == "mtn normal",
+        "telecel" in combo_name_net,
+        _RE_ISHARE.search(combo_name_net) is not None,
+    )
+
+
 def _resolve_package_size_gb(value_obj: dict, item: dict) -> int | None:
     """
     Resolve bundle size (integer GB) to use as Portal/DataConnect "volume".
@@ -279,13 +433,13 @@ def _resolve_package_size_gb(value_obj: dict, item: dict) -> int | None:
     # 3) Parse from item['value'] string like '1GB', '5 GB'
     raw_val = item.get("value") or ""
     if isinstance(raw_val, str):
-        m = re.search(r"(\d+(?:\.\d+)?)\s*gb", raw_val.lower())
+        m = _RE_GB.search(raw_val)
         if m:
             try:
                 return int(float(m.group(1)))
             except Exception:
                 pass
-        m2 = re.search(r"(\d+(?:\.\d+)?)", raw_val)
+        m2 = _RE_NUM.search(raw_val)
         if m2:
             try:
                 return int(float(m2.group(1)))
@@ -324,7 +478,7 @@ def _normalize_msisdn_gh(phone: str) -> str:
     """
     Convert Ghana numbers to international format for Portal-02.
     """
-    p = re.sub(r"\D", "", phone or "")
+    p = _RE_NON_DIGIT.sub("", phone or "")
     if not p:
         return phone
     if p.startswith("0") and len(p) == 10:
@@ -347,24 +501,101 @@ def _resolve_portal02_offer_slug(svc_doc: dict | None, item: dict) -> str:
         if svc_doc.get("offerSlug"):
             return str(svc_doc["offerSlug"])
 
-        nm = str(svc_doc.get("name", "")).lower()
-        net = str(svc_doc.get("network", "")).lower()
-        combo = f"{nm} {net}"
+        name_l = svc_doc.get("_name_l")
+        network_l = svc_doc.get("_network_l")
+        if name_l is None or network_l is None:
+            name_l = str(svc_doc.get("name", "")).lower()
+            network_l = str(svc_doc.get("network", "")).lower()
+        return _portal02_slug_from_names(name_l, network_l)
 
-        if "telecel" in combo:
-            return PORTAL02_OFFER_SLUG_TELECEL
+    return PORTAL02_OFFER_SLUG_MTN_NORMAL
 
-        if (
-            "ishare" in combo
-            or "i share" in combo
-            or "at - ishare" in combo
-            or ("airtel" in combo and "tigo" in combo)
-        ):
-            return PORTAL02_OFFER_SLUG_ISHARE
+
+@lru_cache(maxsize=256)
+def _portal02_slug_from_names(name_l: str, network_l: str) -> str:
+    """
+    Cached keyword match behind _resolve_portal02_offer_slug (inputs already lowercased).
+    """
+    combo = f"{name_l} {network_l}"
+
+    if "telecel" in combo:
+        return PORTAL02_OFFER_SLUG_TELECEL
+
+    if (
+        "ishare" in combo
+        or "i share" in combo
+        or "at - ishare" in combo
+        or ("airtel" in combo and "tigo" in combo)
+    ):
+        return PORTAL02_OFFER_SLUG_ISHARE
 
     return PORTAL02_OFFER_SLUG_MTN_NORMAL
 
 
+# ===== Provider HTTP (retry on transient statuses) ===========================
+# One pooled session for all provider calls: keep-alive + TLS reuse across lines
+# and orders. Adapter-level retries cover connection failures only (the request
+# never reached the provider); status retries are handled in _provider_post.
+_HTTP = requests.Session()
+_HTTP.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=32,
+        max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2),
+    ),
+)
+
+# Only statuses where the provider explicitly did NOT take the order are retried;
+# 502/504 may mean the order went through upstream, so those are left alone.
+PROVIDER_RETRY_STATUSES = (429, 503)
+PROVIDER_MAX_ATTEMPTS = 3
+PROVIDER_MAX_BACKOFF = 3.0
+
+
+def _retry_after_seconds(resp):
+    try:
+        return max(0.0, float(resp.headers.get("Retry-After")))
+    except Exception:
+        return None
+
+
+def _provider_post(url: str, headers: dict, body: dict, order_id: str, external_ref: str):
+    """
+    POST to a provider, retrying 429 / 503 with exponential backoff (honors Retry-After).
+    Returns the last response; network errors propagate to the caller.
+    """
+    data = orjson.dumps(body)  # encoded once, reused across retries; headers carry the JSON content type
+    for attempt in range(PROVIDER_MAX_ATTEMPTS):
+        resp = _HTTP.post(url, headers=headers, data=data, timeout=45)
+        if resp.status_code not in PROVIDER_RETRY_STATUSES or attempt == PROVIDER_MAX_ATTEMPTS - 1:
+            return resp
+        delay = _retry_after_seconds(resp)
+        if delay is None:
+            delay = 0.5 * (2 ** attempt) + random.random() * 0.1
+        delay = min(delay, PROVIDER_MAX_BACKOFF)
+        jlog(
+            "provider_retry",
+            order_id=order_id,
+            ref=external_ref,
+            status=resp.status_code,
+            attempt=attempt + 1,
+            sleep=round(delay, 2),
+        )
+        time.sleep(delay)
+    return resp
+
+
+def _resp_debug(resp, raw: bytes) -> dict:
+    """Small debug summary of a provider response, computed from the raw body bytes."""
+    return {
+        "status": resp.status_code,
+        "body_len": len(raw),
+        # non-cryptographic fingerprint: lets us spot identical error/challenge pages in logs
+        "body_fp": hashlib.blake2b(raw, digest_size=8).hexdigest() if raw else None,
+    }
+
+
 # ===== Provider callers (used by background worker) ==========================
 def _send_dataconnect_order(
     phone: str,
@@ -373,6 +604,7 @@ def _send_dataconnect_order(
     external_ref: str,
     order_id: str,
     debug_events: list,
+    when: datetime | None = None,
 ):
     """
     Sends a single bundle order to DataConnect.
@@ -396,43 +628,33 @@ def _send_dataconnect_order(
         return False, err
 
     url = f"{DATACONNECT_BASE_URL.rstrip('/')}/buy-other-package"
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "x-api-key": DATACONNECT_API_KEY,
-    }
     body = {
         "recipient_msisdn": phone,
         "network_id": int(network_id),
         "shared_bundle": int(shared_bundle),
     }
 
-    masked = phone[:3] + "***" + phone[-2:] if phone and len(phone) >= 5 else "***"
-
-    jlog(
-        "dataconnect_request_body",
-        order_id=order_id,
-        ref=external_ref,
-        url=url,
-        body={
-            "recipient_msisdn": masked,
-            "network_id": body["network_id"],
-            "shared_bundle": body["shared_bundle"],
-        },
-    )
+    if _JLOG_VERBOSE:
+        masked = phone[:3] + "***" + phone[-2:] if phone and len(phone) >= 5 else "***"
+        jlog(
+            "dataconnect_request_body",
+            order_id=order_id,
+            ref=external_ref,
+            url=url,
+            body={
+                "recipient_msisdn": masked,
+                "network_id": body["network_id"],
+                "shared_bundle": body["shared_bundle"],
+            },
+        )
 
     try:
-        resp = requests.post(
-            url,
-            headers=headers,
-            json=body,
-            timeout=45,
-        )
-        text = resp.text or ""
+        resp = _provider_post(url, DATACONNECT_HEADERS, body, order_id, external_ref)
+        raw = resp.content or b""
         try:
-            payload = resp.json()
+            payload = orjson.loads(raw)  # parses the bytes directly; no str decode
         except Exception:
-            payload = {"raw": text} if text else {}
+            payload = {"raw": raw.decode("utf-8", "replace")} if raw else {}
 
         ok = (
             resp.status_code in (200, 201)
@@ -442,16 +664,13 @@ def _send_dataconnect_order(
         if isinstance(payload, dict):
             payload.setdefault("http_status", resp.status_code)
 
-        dbg = {
-            "status": resp.status_code,
-            "body_len": len(text),
-        }
+        dbg = _resp_debug(resp, raw)
         jlog("dataconnect_response", order_id=order_id, ref=external_ref, payload=payload)
         jlog("dataconnect_call", order_id=order_id, ref=external_ref, ok=ok, debug=dbg)
 
         debug_events.append(
             {
-                "when": datetime.utcnow(),
+                "when": when or datetime.utcnow(),
                 "stage": "dataconnect-buy-other-package",
                 "ok": ok,
                 "http_status": resp.status_code,
@@ -476,7 +695,8 @@ def _send_dataconnect_order(
 
 def _send_portal02_order(phone: str, network: str, volume_gb: int,
                          offer_slug: str,
-                         external_ref: str, order_id: str, debug_events: list):
+                         external_ref: str, order_id: str, debug_events: list,
+                         when: datetime | None = None):
     if not PORTAL02_API_KEY or PORTAL02_API_KEY == "dk_your_api_key_here":
         err = {
             "success": False,
@@ -488,11 +708,6 @@ def _send_portal02_order(phone: str, network: str, volume_gb: int,
         return False, err
 
     url = f"{PORTAL02_BASE_URL.rstrip('/')}/order/{network}"
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "x-api-key": PORTAL02_API_KEY,
-    }
     body = {
         "type": "single",
         "volume": int(volume_gb),
@@ -501,31 +716,27 @@ def _send_portal02_order(phone: str, network: str, volume_gb: int,
         "webhookUrl": PORTAL02_WEBHOOK_URL,
     }
 
-    masked = phone[:5] + "***" + phone[-2:] if phone and len(phone) >= 7 else "***"
-    jlog(
-        "portal02_request_body",
-        order_id=order_id,
-        ref=external_ref,
-        body={
-            "network": network,
-            "phone": masked,
-            "volume": body["volume"],
-            "offerSlug": body["offerSlug"],
-        },
-    )
+    if _JLOG_VERBOSE:
+        masked = phone[:5] + "***" + phone[-2:] if phone and len(phone) >= 7 else "***"
+        jlog(
+            "portal02_request_body",
+            order_id=order_id,
+            ref=external_ref,
+            body={
+                "network": network,
+                "phone": masked,
+                "volume": body["volume"],
+                "offerSlug": body["offerSlug"],
+            },
+        )
 
     try:
-        resp = requests.post(
-            url,
-            headers=headers,
-            json=body,
-            timeout=45,
-        )
-        text = resp.text or ""
+        resp = _provider_post(url, PORTAL02_HEADERS, body, order_id, external_ref)
+        raw = resp.content or b""
         try:
-            payload = resp.json()
+            payload = orjson.loads(raw)  # parses the bytes directly; no str decode
         except Exception:
-            payload = {"raw": text} if text else {}
+            payload = {"raw": raw.decode("utf-8", "replace")} if raw else {}
 
         ok = (
             resp.status_code in (200, 201)
@@ -535,15 +746,12 @@ def _send_portal02_order(phone: str, network: str, volume_gb: int,
         if isinstance(payload, dict):
             payload.setdefault("http_status", resp.status_code)
 
-        dbg = {
-            "status": resp.status_code,
-            "body_len": len(text),
-        }
+        dbg = _resp_debug(resp, raw)
         jlog("portal02_response", order_id=order_id, ref=external_ref, payload=payload)
         jlog("portal02_call", order_id=order_id, ref=external_ref, ok=ok, debug=dbg)
         debug_events.append(
             {
-                "when": datetime.utcnow(),
+                "when": when or datetime.utcnow(),
                 "stage": "portal02-place-order",
                 "ok": ok,
                 "http_status": resp.status_code,
@@ -564,8 +772,13 @@ def _service_unavailability_reason(svc_doc: dict):
     if not svc_doc:
         return True, "Closed"
 
-    status = (svc_doc.get("status") or "").strip().upper()
-    availability = (svc_doc.get("availability") or "").strip().upper()
+    # Docs from _load_cart_services carry the normalized fields already
+    status = svc_doc.get("_status_u")
+    if status is None:
+        status = (svc_doc.get("status") or "").strip().upper()
+    availability = svc_doc.get("_availability_u")
+    if availability is None:
+        availability = (svc_doc.get("availability") or "").strip().upper()
 
     if availability in {"OUT_OF_STOCK", "OUT OF STOCK", "OUTOFSTOCK"}:
         return True, "Out of stock"
@@ -578,6 +791,7 @@ def _service_unavailability_reason(svc_doc: dict):
 
 # ===== Duplicate-in-processing guard =========================================
 DUP_WINDOW_MINUTES = 30
+_DUP_WINDOW = timedelta(minutes=DUP_WINDOW_MINUTES)
 
 
 def _normalize_amount_key(v):
@@ -587,18 +801,17 @@ def _normalize_amount_key(v):
         return 0.0
 
 
-def _has_processing_conflict_strict(
+def _conflict_clauses(
     phone: str,
     service_id_raw: str | None,
-    svc_name: str | None,
-    network_id: int | None,
-    bundle_key: tuple | None,
+    network_id: int,
+    bundle_key: tuple,
     amount_key: float,
-) -> bool:
-    if not phone or network_id is None or bundle_key is None:
-        return False
-
-    window_start = datetime.utcnow() - timedelta(minutes=DUP_WINDOW_MINUTES)
+) -> tuple[dict, dict]:
+    """
+    The two order-item shapes that count as "same line already processing":
+    the stored bundle_key, and the value_obj fallback for older items.
+    """
     kind, bval = bundle_key
 
     elem = {
@@ -611,14 +824,6 @@ def _has_processing_conflict_strict(
     if service_id_raw:
         elem["serviceId"] = service_id_raw
 
-    q = {
-        "status": "processing",
-        "created_at": {"$gte": window_start},
-        "items": {"$elemMatch": elem},
-    }
-    if orders_col.find_one(q, {"_id": 1}):
-        return True
-
     alt = {
         "phone": phone,
         "network_id": network_id,
@@ -631,220 +836,466 @@ def _has_processing_conflict_strict(
     if service_id_raw:
         alt["serviceId"] = service_id_raw
 
-    q2 = {
-        "status": "processing",
-        "created_at": {"$gte": window_start},
-        "items": {"$elemMatch": alt},
+    return elem, alt
+
+
+def _dotted_get(doc, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _processing_conflicts(line_keys: list[tuple]) -> set:
+    """
+    Duplicate-in-processing guard for a whole cart in one aggregate.
+    line_keys: (phone, service_id_raw, network_id, bundle_key, amount_key) per line.
+    Returns the subset of keys that already have a "processing" order in the window.
+    """
+    shapes = []  # (line_key, clause)
+    for key in line_keys:
+        phone, service_id_raw, network_id, bundle_key, _ = key
+        if not phone or network_id is None or bundle_key is None:
+            continue
+        if service_id_raw is not None and not isinstance(service_id_raw, str):
+            continue  # malformed id: the line is rejected by the availability gate anyway
+        for clause in _conflict_clauses(*key):
+            shapes.append((key, clause))
+    if not shapes:
+        return set()
+
+    window_start = datetime.utcnow() - _DUP_WINDOW
+    clauses = [c for _, c in shapes]
+    pipeline = [
+        {
+            "$match": {
+                "status": "processing",
+                "created_at": {"$gte": window_start},
+                "$or": [{"items": {"$elemMatch": c}} for c in clauses],
+            }
+        },
+        {"$unwind": "$items"},
+        {"$match": {"$or": [{f"items.{k}": v for k, v in c.items()} for c in clauses]}},
+        {"$replaceRoot": {"newRoot": "$items"}},
+        {
+            "$project": {
+                "phone": 1,
+                "network_id": 1,
+                "bundle_key": 1,
+                "amount": 1,
+                "serviceId": 1,
+                "value_obj.id": 1,
+                "value_obj.volume": 1,
+            }
+        },
+    ]
+    found = list(orders_col.aggregate(pipeline))
+
+    hits = set()
+    for key, clause in shapes:
+        if key not in hits and any(
+            all(_dotted_get(it, k) == v for k, v in clause.items()) for it in found
+        ):
+            hits.add(key)
+    return hits
+
+
+# ===== Service lookup ========================================================
+SERVICE_PROJECTION = {
+    "type": 1,
+    "network_id": 1,
+    "name": 1,
+    "network": 1,
+    "offers": 1,
+    "default_profit_percent": 1,
+    "service_category": 1,
+    "status": 1,
+    "availability": 1,
+    "service_network": 1,
+    "portal02_offer_slug": 1,
+    "offerSlug": 1,
+}
+
+
+# Only the fields _resolve_portal02_offer_slug reads (mirrors the route's svc_doc_snapshot)
+SERVICE_SNAPSHOT_PROJECTION = {
+    "name": 1,
+    "network": 1,
+    "service_network": 1,
+    "portal02_offer_slug": 1,
+    "offerSlug": 1,
+}
+
+
+def _prenormalize_service(doc: dict) -> dict:
+    """
+    Stash the case-normalized name/network/status/availability on the doc once,
+    so the per-line resolvers don't repeat strip()/lower()/upper() for every cart line.
+    """
+    doc["_name_l"] = str(doc.get("name") or "").strip().lower()
+    doc["_network_l"] = str(doc.get("network") or "").strip().lower()
+    doc["_status_u"] = str(doc.get("status") or "").strip().upper()
+    doc["_availability_u"] = str(doc.get("availability") or "").strip().upper()
+    return doc
+
+
+def _load_cart_services(cart: list) -> dict:
+    """
+    Fetch every service referenced by the cart in one $in query.
+    Returns {ObjectId: svc_doc}; unknown/invalid ids are simply absent.
+    """
+    svc_ids = set()
+    for it in cart:
+        sid = it.get("serviceId")
+        if sid:
+            try:
+                svc_ids.add(_oid(sid))
+            except Exception:
+                pass
+    if not svc_ids:
+        return {}
+    try:
+        return {
+            d["_id"]: _prenormalize_service(d)
+            for d in services_col.find({"_id": {"$in": list(svc_ids)}}, SERVICE_PROJECTION)
+        }
+    except Exception:
+        return {}
+
+
+def _line_identity(item: dict, svc_map: dict) -> dict:
+    """
+    Per-line fields needed before any routing: phone, amounts, service doc,
+    internal network id and bundle key (the duplicate-guard identity).
+    """
+    phone = (item.get("phone") or "").strip()
+    value_raw = item.get("value")
+    value_obj = _coerce_value_obj(item.get("value_obj") or value_raw)
+    amt_total = _money(item.get("amount"))
+
+    service_id_raw = item.get("serviceId")
+    svc_doc = None
+    svc_type = None
+    svc_name = item.get("serviceName") or None
+
+    if service_id_raw:
+        try:
+            svc_doc = svc_map.get(_oid(service_id_raw))
+            if svc_doc:
+                st = svc_doc.get("type")
+                svc_type = (st.strip().upper() if isinstance(st, str) else st)
+                svc_name = svc_doc.get("name") or svc_doc.get("network") or svc_name
+        except Exception:
+            svc_doc = None
+            svc_type = None
+
+    return {
+        "phone": phone,
+        "value_raw": value_raw,
+        "value_obj": value_obj,
+        "amt_total": amt_total,
+        "amount_key": _normalize_amount_key(amt_total),
+        "service_id_raw": service_id_raw,
+        "svc_doc": svc_doc,
+        "svc_type": svc_type,
+        "svc_name": svc_name,
+        "network_id": _resolve_network_id(item, value_obj, svc_doc),
+        "bundle_key": _build_bundle_key(value_obj, item),
     }
-    return bool(orders_col.find_one(q2, {"_id": 1}))
 
 
 # ===== BACKGROUND WORKER =====================================================
+BG_MAX_ORDERS = 32  # orders whose provider calls may run at once; the rest queue
+
+_BG_POOL = ThreadPoolExecutor(max_workers=BG_MAX_ORDERS, thread_name_prefix="ckout-bg")
+# One executor per provider, sized to that provider's cap on in-flight POSTs, so a
+# burst for one provider never occupies threads the other provider's jobs are waiting for
+PROVIDER_MAX_INFLIGHT = {"dataconnect": 16, "portal02": 32}
+_PROVIDER_POOLS = {
+    name: ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"ckout-{name}")
+    for name, n in PROVIDER_MAX_INFLIGHT.items()
+}
+
+atexit.register(_BG_POOL.shutdown, wait=False)
+for _pool in _PROVIDER_POOLS.values():
+    atexit.register(_pool.shutdown, wait=False)
+
+
+def _log_bg_failure(fut):
+    exc = fut.exception()
+    if exc is not None:
+        _log_uncaught("checkout_bg_worker_crash", exc)
+
+
+def _dispatch_job(order_id: str, job: dict):
+    """
+    Sends one queued line to its provider.
+    Returns (line_ref, ok, payload, provider_ref, provider_order_id, debug_entries).
+    """
+    line_ref = job["provider_request_order_id"]
+    phone = job["phone"]
+    package_size_gb = job.get("package_size_gb")
+    provider = job["provider"]
+    portal_network_slug = job.get("portal02_network_slug")
+
+    dataconnect_network_id = job.get("network_id")
+    dataconnect_shared_bundle = job.get("shared_bundle")
+
+    # The checkout route snapshots the service fields the worker needs into the job;
+    # callers that only pass service_id (store page) get them loaded here
+    svc_doc = job.get("svc_doc_snapshot")
+    svc_id = job.get("service_id")
+    if svc_doc is None and svc_id:
+        try:
+            svc_doc = services_col.find_one({"_id": svc_id}, SERVICE_SNAPSHOT_PROJECTION)
+        except Exception:
+            svc_doc = None
+
+    ok = False
+    payload = {}
+    debug_entries = []
+    now = datetime.utcnow()  # one timestamp for every debug entry of this job
+
+    if provider == "dataconnect":
+        # DataConnect order
+        ok, payload = _send_dataconnect_order(
+            phone=phone,
+            network_id=dataconnect_network_id,
+            shared_bundle=dataconnect_shared_bundle,
+            external_ref=line_ref,
+            order_id=order_id,
+            debug_events=debug_entries,
+            when=now,
+        )
+
+    elif provider == "portal02":
+        offer_slug = _resolve_portal02_offer_slug(svc_doc or {}, job.get("raw_item") or {})
+        normalized_phone = _normalize_msisdn_gh(phone)
+        ok, payload = _send_portal02_order(
+            phone=normalized_phone,
+            network=portal_network_slug,
+            volume_gb=package_size_gb,
+            offer_slug=offer_slug,
+            external_ref=line_ref,
+            order_id=order_id,
+            debug_events=debug_entries,
+            when=now,
+        )
+
+    provider_ref = None
+    provider_order_id = None
+    if isinstance(payload, dict):
+        provider_ref = (
+            payload.get("transaction_code")
+            or payload.get("reference")
+            or payload.get("order_reference")
+        )
+        provider_order_id = (
+            payload.get("orderId")
+            or payload.get("order_id")
+            or payload.get("transaction_code")
+        )
+
+    return line_ref, ok, payload, provider_ref, provider_order_id, debug_entries
+
+
 def _background_process_providers(order_id: str, api_jobs: list[dict]):
     """
-    Runs in a separate thread AFTER the HTTP response is sent.
-    It picks queued lines and calls DataConnect / Portal-02, then updates the order doc.
+    Runs on _BG_POOL AFTER the HTTP response is sent.
+    It fans the queued lines out to DataConnect / Portal-02 in parallel, then updates the order doc.
     """
     jlog("checkout_bg_worker_start", order_id=order_id, jobs=len(api_jobs))
     local_debug = []
+    ops = []
 
-    for job in api_jobs:
+    futures = [
+        _PROVIDER_POOLS.get(job.get("provider"), _PROVIDER_POOLS["portal02"]).submit(_dispatch_job, order_id, job)
+        for job in api_jobs
+    ]
+    for fut in as_completed(futures):
         try:
-            line_ref = job["provider_request_order_id"]
-            phone = job["phone"]
-            package_size_gb = job.get("package_size_gb")
-            provider = job["provider"]
-            portal_network_slug = job.get("portal02_network_slug")
-            svc_id = job.get("service_id")
-
-            dataconnect_network_id = job.get("network_id")
-            dataconnect_shared_bundle = job.get("shared_bundle")
-
-            svc_doc = None
-            if svc_id:
-                try:
-                    svc_doc = services_col.find_one(
-                        {"_id": svc_id},
-                        {
-                            "type": 1,
-                            "network_id": 1,
-                            "name": 1,
-                            "network": 1,
-                            "offers": 1,
-                            "default_profit_percent": 1,
-                            "service_category": 1,
-                            "status": 1,
-                            "availability": 1,
-                            "service_network": 1,
-                            "portal02_offer_slug": 1,
-                            "offerSlug": 1,
-                        },
-                    )
-                except Exception:
-                    svc_doc = None
-
-            ok = False
-            payload = {}
-
-            if provider == "dataconnect":
-                # DataConnect order
-                ok, payload = _send_dataconnect_order(
-                    phone=phone,
-                    network_id=dataconnect_network_id,
-                    shared_bundle=dataconnect_shared_bundle,
-                    external_ref=line_ref,
-                    order_id=order_id,
-                    debug_events=local_debug,
-                )
+            line_ref, ok, payload, provider_ref, provider_order_id, debug_entries = fut.result()
+            local_debug.extend(debug_entries)
 
-            elif provider == "portal02":
-                offer_slug = _resolve_portal02_offer_slug(svc_doc or {}, job.get("raw_item") or {})
-                normalized_phone = _normalize_msisdn_gh(phone)
-                ok, payload = _send_portal02_order(
-                    phone=normalized_phone,
-                    network=portal_network_slug,
-                    volume_gb=package_size_gb,
-                    offer_slug=offer_slug,
-                    external_ref=line_ref,
-                    order_id=order_id,
-                    debug_events=local_debug,
-                )
-
-            provider_ref = None
-            provider_order_id = None
-            if isinstance(payload, dict):
-                provider_ref = (
-                    payload.get("transaction_code")
-                    or payload.get("reference")
-                    or payload.get("order_reference")
-                )
-                provider_order_id = (
-                    payload.get("orderId")
-                    or payload.get("order_id")
-                    or payload.get("transaction_code")
+            # Update this specific line inside the order items (flushed in one bulk_write below)
+            ops.append(
+                UpdateOne(
+                    {
+                        "order_id": order_id,
+                        "items.provider_request_order_id": line_ref,
+                    },
+                    {
+                        "$set": {
+                            "items.$.api_status": "success" if ok else "processing",
+                            "items.$.api_response": payload,
+                            "items.$.provider_reference": provider_ref,
+                            "items.$.provider_order_id": provider_order_id,
+                        }
+                    },
                 )
-
-            # Update this specific line inside the order items
-            orders_col.update_one(
-                {
-                    "order_id": order_id,
-                    "items.provider_request_order_id": line_ref,
-                },
-                {
-                    "$set": {
-                        "items.$.api_status": "success" if ok else "processing",
-                        "items.$.api_response": payload,
-                        "items.$.provider_reference": provider_ref,
-                        "items.$.provider_order_id": provider_order_id,
-                    }
-                },
             )
         except Exception as e:
             jlog("checkout_bg_worker_line_error", order_id=order_id, error=str(e))
 
+    if ops:
+        try:
+            orders_col.bulk_write(ops, ordered=False)
+        except Exception as e:
+            jlog("checkout_bg_worker_write_error", order_id=order_id, error=str(e))
+
     if local_debug:
-        # append debug entries
+        # append debug entries (fire-and-forget; the line updates above stay acknowledged)
         try:
-            orders_col.update_one(
-                {"order_id": order_id},
-                {"$push": {"debug.events": {"$each": local_debug}}},
-            )
-        except Exception:
-            pass
+            _orders_fast.update_one({"order_id": order_id}, {"$push": {"debug.events": {"$each": local_debug}}})
+        except Exception as e:
+            jlog("checkout_bg_worker_debug_error", order_id=order_id, error=str(e))
 
     jlog("checkout_bg_worker_end", order_id=order_id, jobs=len(api_jobs))
 
 
 # ===== Route (FAST RESPONSE, PROVIDERS IN BACKGROUND) ========================
+_MSG_SKIPPED = (
+    "No charge taken. %d item(s) were skipped because the same phone, network, bundle, "
+    "and amount already has an order in processing or duplicated in cart."
+)
+_MSG_PROCESSING = "📝 Order received and is processing. We’ve charged your wallet. Order ID: %s"
+_SERVER_ERROR_BODY = orjson.dumps({"success": False, "message": "Server error"})
+_SERVER_ERROR_HEADERS = {"Cache-Control": "no-store"}
+
+# Fixed-shape 200 envelopes; %s slots take orjson-encoded values, %d slots plain ints.
+_TMPL_SKIPPED = (
+    b'{"success":true,"message":%s,"order_id":%s,"redirect_url":%s,"status":"skipped",'
+    b'"charged_amount":0.0,"profit_amount_total":0.0,"skipped_count":%d,"items":%s}'
+)
+_TMPL_PROCESSING = (
+    b'{"success":true,"message":%s,"order_id":%s,"redirect_url":%s,"status":%s,'
+    b'"charged_amount":%s,"profit_amount_total":%s,"processing_count":%d,"skipped_count":%d,"items":%s}'
+)
+
+
+def _base_line(line_ctx: dict, base_amount, amount, profit_amount, profit_percent_used,
+               service_type, line_status: str, api_status: str, api_response: dict) -> dict:
+    """
+    One cart line as stored on the order and echoed back in the response:
+    the per-item context plus the money/status fields every branch sets.
+    """
+    return {
+        **line_ctx,
+        "base_amount": base_amount,
+        "amount": amount,
+        "profit_amount": profit_amount,
+        "profit_percent_used": profit_percent_used,
+        "service_type": service_type,
+        "line_status": line_status,
+        "api_status": api_status,
+        "api_response": api_response,
+    }
+
+
+def _cart_cached(cache: dict, key, fn, *args):
+    """
+    Per-cart memo: lines buying the same bundle share one resolver result.
+    Keys built from unhashable item fields (dict/list values) just skip the cache.
+    """
+    try:
+        return cache[key]
+    except KeyError:
+        val = cache[key] = fn(*args)
+        return val
+    except TypeError:
+        return fn(*args)
+
+
 @checkout_bp.route("/checkout", methods=["POST"])
 def process_checkout():
-    try:
-        # Auth
-        if "user_id" not in session or session.get("role") != "customer":
-            jlog("checkout_auth_fail", session_keys=list(session.keys()))
-            return jsonify({"success": False, "message": "Not authorized"}), 401
+    _round, _jsonify = round, jsonify  # locals: hot path uses LOAD_FAST instead of global lookups
 
-        try:
-            user_id = ObjectId(session["user_id"])
-        except Exception:
-            return jsonify({"success": False, "message": "Invalid user ID"}), 400
+    # Auth + payload validation: failures here are expected 4xx, so they stay outside the broad handler
+    if "user_id" not in session or session.get("role") != "customer":
+        jlog_async("checkout_auth_fail")
+        return _jsonify({"success": False, "message": "Not authorized"}), 401
+
+    try:
+        user_id = ObjectId(session["user_id"])
+    except Exception:
+        return _jsonify({"success": False, "message": "Invalid user ID"}), 400
 
-        data = request.get_json(silent=True) or {}
-        cart = data.get("cart", [])
-        method = data.get("method", "wallet")
-        jlog("checkout_incoming", payload=data)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    cart = data.get("cart", [])
+    method = data.get("method", "wallet")
+    if _JLOG_VERBOSE:
+        jlog_async("checkout_incoming", payload=data)
 
-        if not cart or not isinstance(cart, list):
-            return jsonify({"success": False, "message": "Cart is empty or invalid"}), 400
+    if not cart or not isinstance(cart, list) or not all(isinstance(it, dict) for it in cart):
+        return _jsonify({"success": False, "message": "Cart is empty or invalid"}), 400
 
-        # Total requested (customer-facing)
-        total_requested = sum(_money(item.get("amount")) for item in cart)
+    try:
+        svc_map = _load_cart_services(cart)  # one round-trip for every service in the cart
+
+        # Pass 1: identity of every line (so the duplicate-in-processing guard is one query per cart)
+        # and the customer-facing total, in the same walk over the cart
+        lines = []
+        total_requested = 0.0
+        for item in cart:
+            ln = _line_identity(item, svc_map)
+            lines.append(ln)
+            total_requested += ln["amt_total"]
         if total_requested <= 0:
-            return jsonify({"success": False, "message": "Total amount must be greater than zero"}), 400
+            return _jsonify({"success": False, "message": "Total amount must be greater than zero"}), 400
 
         order_id = generate_order_id()
 
         # Balance check
         bal_doc = balances_col.find_one({"user_id": user_id}) or {}
         current_balance = _money(bal_doc.get("amount", 0))
-        jlog("checkout_balance", order_id=order_id, balance=current_balance, total=total_requested)
+        if _JLOG_VERBOSE:
+            jlog_async("checkout_balance", order_id=order_id, balance=current_balance, total=total_requested)
         if current_balance < total_requested:
-            return jsonify({"success": False, "message": "❌ Insufficient wallet balance"}), 400
+            return _jsonify({"success": False, "message": "❌ Insufficient wallet balance"}), 400
 
-        results = []
-        debug_events = []
+        results = [None] * len(cart)  # exactly one entry per cart line, filled by position
+        debug_events = deque(maxlen=10)  # only the most recent events are kept on the order
 
         total_delivered_api_amount = 0.0  # stays 0.0 (we don't mark delivered immediately)
         total_processing_amount = 0.0
         api_requested_total = 0.0
-        has_processing = False
+        processing_count = 0  # lines left in "processing" (queued or manual)
+        skipped_count = 0  # duplicate lines, in cart or already processing
         profit_amount_total = 0.0
 
         seen_keys = set()
+        svc_flags_cache = {}  # (service _id, display name) -> _classify_service flags
+        net_cache = {}  # (service _id, item network fields) -> _resolve_dataconnect_network
+        pkg_cache = {}  # (value_obj, value) as sent -> _resolve_package_size_gb
         api_jobs = []  # lines to be sent to providers in the background worker
 
-        for idx, item in enumerate(cart, start=1):
-            phone = (item.get("phone") or "").strip()
-            value_obj = _coerce_value_obj(item.get("value_obj") or item.get("value"))
-            amt_total = _money(item.get("amount"))
-            amount_key = _normalize_amount_key(amt_total)
-
-            service_id_raw = item.get("serviceId")
-            svc_doc = None
-            svc_type = None
-            svc_name = item.get("serviceName") or None
+        conflict_keys = _processing_conflicts(
+            [
+                (ln["phone"], ln["service_id_raw"], ln["network_id"], ln["bundle_key"], ln["amount_key"])
+                for ln in lines
+            ]
+        )
 
-            if service_id_raw:
-                try:
-                    svc_doc = services_col.find_one(
-                        {"_id": ObjectId(service_id_raw)},
-                        {
-                            "type": 1,
-                            "network_id": 1,
-                            "name": 1,
-                            "network": 1,
-                            "offers": 1,
-                            "default_profit_percent": 1,
-                            "service_category": 1,
-                            "status": 1,
-                            "availability": 1,
-                            "service_network": 1,
-                            "portal02_offer_slug": 1,
-                            "offerSlug": 1,
-                        },
-                    )
-                    if svc_doc:
-                        st = svc_doc.get("type")
-                        svc_type = (st.strip().upper() if isinstance(st, str) else st)
-                        svc_name = svc_doc.get("name") or svc_doc.get("network") or svc_name
-                except Exception:
-                    svc_doc = None
-                    svc_type = None
+        for idx, (item, ln) in enumerate(zip(cart, lines), start=1):
+            phone = ln["phone"]
+            value_obj = ln["value_obj"]
+            amt_total = ln["amt_total"]
+            amount_key = ln["amount_key"]
+            service_id_raw = ln["service_id_raw"]
+            svc_doc = ln["svc_doc"]
+            svc_type = ln["svc_type"]
+            svc_name = ln["svc_name"]
+            network_id = ln["network_id"]
+            bundle_key = ln["bundle_key"]
+            bundle_key_doc = {"kind": bundle_key[0], "value": bundle_key[1]} if bundle_key else None
 
             # HARD GATE: availability
             is_unavail, reason_text = _service_unavailability_reason(svc_doc)
             if is_unavail:
-                return jsonify(
+                return _jsonify(
                     {
                         "success": False,
                         "message": reason_text,
@@ -857,114 +1308,78 @@ def process_checkout():
                 ), 400
 
             # Duplicate guards
-            network_id = _resolve_network_id(item, value_obj, svc_doc)
-            bundle_key = _build_bundle_key(value_obj, item)
+            # Fields shared by every result line for this item
+            line_ctx = {
+                "phone": phone,
+                "value": ln["value_raw"],
+                "value_obj": value_obj,
+                "serviceId": service_id_raw,
+                "serviceName": svc_name,
+                "network_id": network_id,
+                "bundle_key": bundle_key_doc,
+                "line_amount_key": amount_key,
+            }
 
             if phone and (network_id is not None) and (bundle_key is not None):
                 cart_key = (phone, int(network_id), bundle_key[1], bundle_key[0], amount_key)
                 if cart_key in seen_keys:
-                    results.append(
-                        {
-                            "phone": phone,
-                            "base_amount": 0.0,
-                            "amount": 0.0,
-                            "originally_requested_amount": amt_total,
-                            "profit_amount": 0.0,
-                            "profit_percent_used": 0.0,
-                            "value": item.get("value"),
-                            "value_obj": value_obj,
-                            "serviceId": service_id_raw,
-                            "serviceName": svc_name,
-                            "service_type": svc_type if svc_type else ("unknown" if not svc_doc else None),
-                            "network_id": network_id,
-                            "bundle_key": {"kind": bundle_key[0], "value": bundle_key[1]},
-                            "line_amount_key": amount_key,
-                            "line_status": "skipped_duplicate_in_cart",
-                            "api_status": "skipped",
-                            "api_response": {
-                                "note": "Duplicate line in this cart (same number, network, bundle, amount)"
-                            },
-                        }
+                    rec = _base_line(
+                        line_ctx, 0.0, 0.0, 0.0, 0.0,
+                        svc_type if svc_type else ("unknown" if not svc_doc else None),
+                        "skipped_duplicate_in_cart",
+                        "skipped",
+                        {"note": "Duplicate line in this cart (same number, network, bundle, amount)"},
                     )
+                    rec["originally_requested_amount"] = amt_total
+                    results[idx - 1] = rec
+                    skipped_count += 1
                     continue
                 seen_keys.add(cart_key)
 
-            is_dup_strict = _has_processing_conflict_strict(
-                phone, service_id_raw, svc_name, network_id, bundle_key, amount_key
-            )
-            if is_dup_strict:
-                results.append(
-                    {
-                        "phone": phone,
-                        "base_amount": 0.0,
-                        "amount": 0.0,
-                        "originally_requested_amount": amt_total,
-                        "profit_amount": 0.0,
-                        "profit_percent_used": 0.0,
-                        "value": item.get("value"),
-                        "value_obj": value_obj,
-                        "serviceId": service_id_raw,
-                        "serviceName": svc_name,
-                        "service_type": svc_type if svc_type else ("unknown" if not svc_doc else None),
-                        "network_id": network_id,
-                        "bundle_key": ({"kind": bundle_key[0], "value": bundle_key[1]} if bundle_key else None),
-                        "line_amount_key": amount_key,
-                        "line_status": "skipped_duplicate_processing",
-                        "api_status": "skipped",
-                        "api_response": {
-                            "note": "Same number + same network + same bundle + same amount already processing; skipping."
-                        },
-                    }
+            if (phone, service_id_raw, network_id, bundle_key, amount_key) in conflict_keys:
+                rec = _base_line(
+                    line_ctx, 0.0, 0.0, 0.0, 0.0,
+                    svc_type if svc_type else ("unknown" if not svc_doc else None),
+                    "skipped_duplicate_processing",
+                    "skipped",
+                    {"note": "Same number + same network + same bundle + same amount already processing; skipping."},
                 )
+                rec["originally_requested_amount"] = amt_total
+                results[idx - 1] = rec
+                skipped_count += 1
                 continue
 
             # base & profit (requested): profit = amount - base_amount
             base_hint = _to_float(item.get("base_amount"))
-            base_amount = round(float(base_hint if base_hint is not None else 0.0), 2)
-            profit_amount = max(0.0, round(amt_total - base_amount, 2))
-            profit_percent_used = round((profit_amount / base_amount) * 100.0, 2) if base_amount > 0 else 0.0
+            base_amount = _round(base_hint, 2) if base_hint is not None else 0.0  # _to_float already gave a float
+            profit_amount = max(0.0, _round(amt_total - base_amount, 2))
+            profit_percent_used = _round((profit_amount / base_amount) * 100.0, 2) if base_amount > 0 else 0.0
             profit_amount_total += profit_amount
 
             # No service doc → manual processing
             if not svc_doc:
-                has_processing = True
+                processing_count += 1
                 total_processing_amount += amt_total
-                results.append(
-                    {
-                        "phone": phone,
-                        "base_amount": base_amount,
-                        "amount": amt_total,
-                        "profit_amount": profit_amount,
-                        "profit_percent_used": profit_percent_used,
-                        "value": item.get("value"),
-                        "value_obj": value_obj,
-                        "serviceId": service_id_raw,
-                        "serviceName": svc_name,
-                        "service_type": svc_type if svc_type else "unknown",
-                        "network_id": network_id,
-                        "bundle_key": ({"kind": bundle_key[0], "value": bundle_key[1]} if bundle_key else None),
-                        "line_amount_key": amount_key,
-                        "line_status": "processing",
-                        "api_status": "not_applicable",
-                        "api_response": {"note": "Service not found; queued for processing"},
-                    }
+                results[idx - 1] = _base_line(
+                    line_ctx, base_amount, amt_total, profit_amount, profit_percent_used,
+                    svc_type if svc_type else "unknown",
+                    "processing",
+                    "not_applicable",
+                    {"note": "Service not found; queued for processing"},
                 )
                 continue
 
             # Provider selection
-            resolved_network = _resolve_dataconnect_network(svc_doc, item)
-            svc_name_norm = (svc_name or "").strip().lower()
-            svc_network_norm = (svc_doc.get("network") or "").strip().lower() if svc_doc else ""
-            combo_name_net = f"{svc_name_norm} {svc_network_norm}"
-
-            is_mtn_express = (svc_name_norm == "mtn express")
-            is_mtn_normal = (svc_name_norm == "mtn normal")
-            is_telecel_bundle = ("telecel" in combo_name_net)
-            is_ishare_bundle = (
-                "ishare" in combo_name_net
-                or "i share" in combo_name_net
-                or "at - ishare" in combo_name_net
+            resolved_network = _cart_cached(
+                net_cache,
+                (svc_doc["_id"], item.get("network"), item.get("network_name"), item.get("serviceName")),
+                _resolve_dataconnect_network, svc_doc, item,
             )
+            flags_key = (svc_doc["_id"], svc_name)
+            svc_flags = svc_flags_cache.get(flags_key)
+            if svc_flags is None:
+                svc_flags = svc_flags_cache[flags_key] = _classify_service(svc_doc, svc_name)
+            is_mtn_express, is_mtn_normal, is_telecel_bundle, is_ishare_bundle = svc_flags
 
             svc_type_flag = (svc_type or "").strip().upper() if isinstance(svc_type, str) else ""
             type_allows_api = svc_type_flag in ("ON", "API")
@@ -977,115 +1392,60 @@ def process_checkout():
 
             portal02_network_slug = None
             if api_allowed:
-                if resolved_network == "mtn" and is_mtn_normal:
-                    portal02_network_slug = "mtn"
-                elif resolved_network == "telecel" and is_telecel_bundle:
-                    portal02_network_slug = "telecel"
-                elif resolved_network == "airteltigo" and is_ishare_bundle:
-                    portal02_network_slug = "airteltigo"
+                route = _PORTAL02_TABLE.get(resolved_network)
+                if route is not None and svc_flags[route[0]]:
+                    portal02_network_slug = route[1]
 
             use_portal02 = portal02_network_slug is not None
 
-            jlog(
-                "checkout_line_routing",
-                order_id=order_id,
-                idx=idx,
-                serviceId=service_id_raw,
-                svc_name=svc_name,
-                resolved_network=resolved_network,
-                svc_type_flag=svc_type_flag,
-                is_mtn_express=is_mtn_express,
-                is_mtn_normal=is_mtn_normal,
-                is_telecel_bundle=is_telecel_bundle,
-                is_ishare_bundle=is_ishare_bundle,
-                api_allowed=api_allowed,
-                use_dataconnect=use_dataconnect,
-                use_portal02=use_portal02,
-                portal02_network_slug=portal02_network_slug,
-            )
-
-            if not (use_dataconnect or use_portal02):
-                has_processing = True
-                total_processing_amount += amt_total
+            if _JLOG_VERBOSE:
+                jlog_async(
+                    "checkout_line_routing",
+                    order_id=order_id,
+                    idx=idx,
+                    serviceId=service_id_raw,
+                    svc_name=svc_name,
+                    resolved_network=resolved_network,
+                    svc_type_flag=svc_type_flag,
+                    is_mtn_express=is_mtn_express,
+                    is_mtn_normal=is_mtn_normal,
+                    is_telecel_bundle=is_telecel_bundle,
+                    is_ishare_bundle=is_ishare_bundle,
+                    api_allowed=api_allowed,
+                    use_dataconnect=use_dataconnect,
+                    use_portal02=use_portal02,
+                    portal02_network_slug=portal02_network_slug,
+                )
 
-                if not api_allowed:
-                    note = (
-                        "API calls disabled for this service (type OFF and not a mapped Telecel/iShare); "
-                        "queued for manual processing."
-                    )
-                    api_status = "not_applicable_type_off"
-                else:
-                    note = (
-                        "API is used for MTN EXPRESS (DataConnect) and MTN NORMAL / TELECEL / AIRTELTIGO iShare "
-                        "via Portal-02, but this line did not match any mapped combination; queued for manual processing."
-                    )
-                    api_status = "not_applicable_network"
+            # Common case first: API-eligible line → we will send it via BACKGROUND worker
+            if use_dataconnect or use_portal02:
+                api_requested_total += amt_total
 
-                results.append(
-                    {
-                        "phone": phone,
-                        "base_amount": base_amount,
-                        "amount": amt_total,
-                        "profit_amount": profit_amount,
-                        "profit_percent_used": profit_percent_used,
-                        "value": item.get("value"),
-                        "value_obj": value_obj,
-                        "serviceId": service_id_raw,
-                        "serviceName": svc_name,
-                        "service_type": svc_type,
-                        "network_id": network_id,
-                        "bundle_key": ({"kind": bundle_key[0], "value": bundle_key[1]} if bundle_key else None),
-                        "line_amount_key": amount_key,
-                        "line_status": "processing",
-                        "api_status": api_status,
-                        "api_response": {
-                            "note": note,
-                            "resolved_network": resolved_network,
-                            "serviceName": svc_name,
-                            "service_type_flag": svc_type_flag,
-                        },
-                    }
+                package_size_gb = _cart_cached(
+                    pkg_cache, (item.get("value_obj"), ln["value_raw"]), _resolve_package_size_gb, value_obj, item
                 )
-                continue
 
-            # From here: API-eligible line → we will send it via BACKGROUND worker
-            api_requested_total += amt_total
-
-            package_size_gb = _resolve_package_size_gb(value_obj, item)
-
-            # Resolve shared_bundle for DataConnect from your stored offer structure
-            shared_bundle = None
-            if isinstance(value_obj, dict):
-                sb = value_obj.get("volume") or value_obj.get("shared_bundle") or value_obj.get("mb")
-                if sb not in (None, "", []):
-                    try:
-                        shared_bundle = int(float(sb))
-                    except Exception:
-                        shared_bundle = None
-            if shared_bundle is None and package_size_gb is not None:
-                shared_bundle = int(package_size_gb * 1000)
-
-            if not phone or package_size_gb is None:
-                has_processing = True
-                total_processing_amount += amt_total
-                results.append(
-                    {
-                        "phone": phone,
-                        "base_amount": base_amount,
-                        "amount": amt_total,
-                        "profit_amount": profit_amount,
-                        "profit_percent_used": profit_percent_used,
-                        "value": item.get("value"),
-                        "value_obj": value_obj,
-                        "serviceId": service_id_raw,
-                        "serviceName": svc_name,
-                        "service_type": svc_type,
-                        "network_id": network_id,
-                        "bundle_key": ({"kind": bundle_key[0], "value": bundle_key[1]} if bundle_key else None),
-                        "line_amount_key": amount_key,
-                        "line_status": "processing",
-                        "api_status": "skipped_missing_fields",
-                        "api_response": {
+                # Resolve shared_bundle for DataConnect from your stored offer structure
+                shared_bundle = None
+                if isinstance(value_obj, dict):
+                    sb = value_obj.get("volume") or value_obj.get("shared_bundle") or value_obj.get("mb")
+                    if sb not in (None, "", []):
+                        try:
+                            shared_bundle = int(float(sb))
+                        except Exception:
+                            shared_bundle = None
+                if shared_bundle is None and package_size_gb is not None:
+                    shared_bundle = int(package_size_gb * 1000)
+
+                if not phone or package_size_gb is None:
+                    processing_count += 1
+                    total_processing_amount += amt_total
+                    results[idx - 1] = _base_line(
+                        line_ctx, base_amount, amt_total, profit_amount, profit_percent_used,
+                        svc_type,
+                        "processing",
+                        "skipped_missing_fields",
+                        {
                             "note": "API fields missing; queued for processing",
                             "got": {
                                 "phone": bool(phone),
@@ -1093,209 +1453,218 @@ def process_checkout():
                                 "package_size_gb": package_size_gb,
                             },
                         },
-                    }
-                )
-                continue
+                    )
+                    continue
 
-            # Prepare background job meta
-            external_ref = f"{order_id}_{idx}_{uuid.uuid4().hex[:6]}"
+                # Prepare background job meta
+                external_ref = f"{order_id}_{idx}_{uuid.uuid4().hex[:6]}"
 
-            if use_dataconnect:
-                provider_name = "dataconnect"
-                provider_network_slug = resolved_network  # for debug only
-            else:
-                provider_name = "portal02"
-                provider_network_slug = portal02_network_slug
+                if use_dataconnect:
+                    provider_name = "dataconnect"
+                    provider_network_slug = resolved_network  # for debug only
+                else:
+                    provider_name = "portal02"
+                    provider_network_slug = portal02_network_slug
 
-            has_processing = True
-            total_processing_amount += amt_total
+                processing_count += 1
+                total_processing_amount += amt_total
 
-            # store line with "queued" status; background worker will update
-            line_record = {
-                "phone": phone,
-                "base_amount": base_amount,
-                "amount": amt_total,
-                "profit_amount": profit_amount,
-                "profit_percent_used": profit_percent_used,
-                "value": item.get("value"),
-                "value_obj": value_obj,
-                "serviceId": service_id_raw,
-                "serviceName": svc_name,
-                "service_type": svc_type,
-                "provider": provider_name,
-                "provider_network": provider_network_slug,
-                "provider_reference": None,
-                "provider_order_id": None,
-                "provider_request_order_id": external_ref,
-                "network_id": network_id,
-                "bundle_key": ({"kind": bundle_key[0], "value": bundle_key[1]} if bundle_key else None),
-                "line_amount_key": amount_key,
-                "line_status": "processing",
-                "api_status": "queued",      # <--- queued for background call
-                "api_response": {"note": "Queued for background API call"},
-            }
+                # store line with "queued" status; background worker will update
+                line_record = _base_line(
+                    line_ctx, base_amount, amt_total, profit_amount, profit_percent_used,
+                    svc_type,
+                    "processing",
+                    "queued",  # <--- queued for background call
+                    {"note": "Queued for background API call"},
+                )
+                line_record["provider"] = provider_name
+                line_record["provider_network"] = provider_network_slug
+                line_record["provider_reference"] = None
+                line_record["provider_order_id"] = None
+                line_record["provider_request_order_id"] = external_ref
+
+                # For transparency/debug you can store shared_bundle on the line as well
+                if use_dataconnect:
+                    line_record["shared_bundle"] = shared_bundle
+
+                results[idx - 1] = line_record
+
+                job_payload = {
+                    "provider_request_order_id": external_ref,
+                    "phone": phone,
+                    "provider": provider_name,
+                    "portal02_network_slug": portal02_network_slug,
+                    "package_size_gb": package_size_gb,
+                    "service_id": svc_doc["_id"],
+                    # only the fields _resolve_portal02_offer_slug reads; the worker never re-queries services
+                    "svc_doc_snapshot": {
+                        "name": svc_doc.get("name"),
+                        "network": svc_doc.get("network"),
+                        "service_network": svc_doc.get("service_network"),
+                        "portal02_offer_slug": svc_doc.get("portal02_offer_slug"),
+                        "offerSlug": svc_doc.get("offerSlug"),
+                        "_name_l": svc_doc["_name_l"],
+                        "_network_l": svc_doc["_network_l"],
+                    },
+                    "raw_item": item,
+                }
 
-            # For transparency/debug you can store shared_bundle on the line as well
-            if use_dataconnect:
-                line_record["shared_bundle"] = shared_bundle
+                if provider_name == "dataconnect":
+                    job_payload["network_id"] = network_id
+                    job_payload["shared_bundle"] = shared_bundle
 
-            results.append(line_record)
+                api_jobs.append(job_payload)
+                continue
 
-            job_payload = {
-                "provider_request_order_id": external_ref,
-                "phone": phone,
-                "provider": provider_name,
-                "portal02_network_slug": portal02_network_slug,
-                "package_size_gb": package_size_gb,
-                "service_id": svc_doc["_id"],
-                "raw_item": item,
-            }
+            # Not routable to a provider → manual processing
+            processing_count += 1
+            total_processing_amount += amt_total
 
-            if provider_name == "dataconnect":
-                job_payload["network_id"] = network_id
-                job_payload["shared_bundle"] = shared_bundle
+            if not api_allowed:
+                note = (
+                    "API calls disabled for this service (type OFF and not a mapped Telecel/iShare); "
+                    "queued for manual processing."
+                )
+                api_status = "not_applicable_type_off"
+            else:
+                note = (
+                    "API is used for MTN EXPRESS (DataConnect) and MTN NORMAL / TELECEL / AIRTELTIGO iShare "
+                    "via Portal-02, but this line did not match any mapped combination; queued for manual processing."
+                )
+                api_status = "not_applicable_network"
 
-            api_jobs.append(job_payload)
+            results[idx - 1] = _base_line(
+                line_ctx, base_amount, amt_total, profit_amount, profit_percent_used,
+                svc_type,
+                "processing",
+                api_status,
+                {
+                    "note": note,
+                    "resolved_network": resolved_network,
+                    "serviceName": svc_name,
+                    "service_type_flag": svc_type_flag,
+                },
+            )
 
-        if len(debug_events) > 10:
-            debug_events = debug_events[-10:]
+        # Round the money totals once; the same values go to the order, the audit meta and the response
+        total_to_charge_now = _round(total_delivered_api_amount + total_processing_amount, 2)
+        total_processing_amount = _round(total_processing_amount, 2)
+        profit_amount_total = _round(profit_amount_total, 2)
 
-        total_to_charge_now = round(total_delivered_api_amount + total_processing_amount, 2)
+        now = datetime.utcnow()  # one timestamp for the balance, order and transaction writes
+        order_oid = ObjectId()
+        # every identifier a customer may quote back (complaints look orders up by this one indexed field)
+        order_lookup_keys = [order_id, str(order_oid)]
 
         # If nothing to charge (all skipped)
         if total_to_charge_now <= 0:
             orders_col.insert_one(
                 {
+                    "_id": order_oid,
                     "user_id": user_id,
                     "order_id": order_id,
+                    "order_lookup_keys": order_lookup_keys,
                     "items": results,
                     "total_amount": 0.0,
                     "charged_amount": 0.0,
                     "profit_amount_total": 0.0,
                     "status": "skipped",
                     "paid_from": method,
-                    "created_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow(),
-                    "debug": {"events": debug_events},
+                    "created_at": now,
+                    "updated_at": now,
+                    "debug": {"events": list(debug_events)},
                 }
             )
-            skipped_count = sum(
-                1
-                for it in results
-                if it.get("line_status") in ("skipped_duplicate_processing", "skipped_duplicate_in_cart")
-            )
-            return (
-                jsonify(
-                    {
-                        "success": True,
-                        "message": (
-                            "No charge taken. {n} item(s) were skipped because the same phone, network, bundle, "
-                            "and amount already has an order in processing or duplicated in cart."
-                        ).format(n=skipped_count),
-                        "order_id": order_id,
-                        "redirect_url": f"/invoice/{order_id}",
-                        "status": "skipped",
-                        "charged_amount": 0.0,
-                        "profit_amount_total": 0.0,
-                        "skipped_count": skipped_count,
-                        "items": results,
-                    }
+            return Response(
+                _TMPL_SKIPPED % (
+                    orjson.dumps(_MSG_SKIPPED % skipped_count),
+                    orjson.dumps(order_id),
+                    orjson.dumps(f"/invoice/{order_id}"),
+                    skipped_count,
+                    orjson.dumps(results),
                 ),
-                200,
+                status=200,
+                mimetype="application/json",
             )
 
-        # Deduct balance NOW
-        balances_col.update_one(
-            {"user_id": user_id},
-            {"$inc": {"amount": -total_to_charge_now}, "$set": {"updated_at": datetime.utcnow()}},
-            upsert=True,
-        )
-
         status = "processing"
 
-        # Persist order
-        orders_col.insert_one(
-            {
-                "user_id": user_id,
-                "order_id": order_id,
-                "items": results,
-                "total_amount": total_requested,
-                "charged_amount": total_to_charge_now,
-                "profit_amount_total": round(profit_amount_total, 2),
-                "status": status,
-                "paid_from": method,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow(),
-                "debug": {"events": debug_events},
-            }
-        )
+        order_doc = {
+            "_id": order_oid,
+            "user_id": user_id,
+            "order_id": order_id,
+            "order_lookup_keys": order_lookup_keys,
+            "items": results,
+            "total_amount": total_requested,
+            "charged_amount": total_to_charge_now,
+            "profit_amount_total": profit_amount_total,
+            "status": status,
+            "paid_from": method,
+            "created_at": now,
+            "updated_at": now,
+            "debug": {"events": list(debug_events)},
+        }
+        tx_doc = {
+            "user_id": user_id,
+            "amount": total_to_charge_now,
+            "reference": order_id,
+            "status": "success",
+            "type": "purchase",
+            "gateway": "Wallet",
+            "currency": "GHS",
+            "created_at": now,
+            "verified_at": now,
+            "meta": {
+                "order_status": status,
+                "api_delivered_amount": _round(total_delivered_api_amount, 2),
+                "processing_amount": total_processing_amount,
+                "profit_amount_total": profit_amount_total,
+            },
+        }
 
-        # Record transaction
-        transactions_col.insert_one(
-            {
-                "user_id": user_id,
-                "amount": total_to_charge_now,
-                "reference": order_id,
-                "status": "success",
-                "type": "purchase",
-                "gateway": "Wallet",
-                "currency": "GHS",
-                "created_at": datetime.utcnow(),
-                "verified_at": datetime.utcnow(),
-                "meta": {
-                    "order_status": status,
-                    "api_delivered_amount": round(total_delivered_api_amount, 2),
-                    "processing_amount": round(total_processing_amount, 2),
-                    "profit_amount_total": round(profit_amount_total, 2),
-                },
-            }
-        )
+        def _persist_charge(db_session):
+            # Deduct balance, persist order, record transaction: all three commit or none do
+            balances_col.update_one(
+                {"user_id": user_id},
+                {"$inc": {"amount": -total_to_charge_now}, "$set": {"updated_at": now}},
+                upsert=True,
+                session=db_session,
+            )
+            orders_col.insert_one(order_doc, session=db_session)
+            transactions_col.insert_one(tx_doc, session=db_session)
 
-        skipped_count = sum(
-            1
-            for it in results
-            if it.get("line_status") in ("skipped_duplicate_processing", "skipped_duplicate_in_cart")
-        )
-        processing_count = sum(1 for it in results if it.get("line_status") == "processing")
+        with db.client.start_session() as db_session:
+            db_session.with_transaction(_persist_charge)
 
         # 🔥 Spawn background worker for provider calls (does not block response)
         if api_jobs:
             try:
-                t = threading.Thread(
-                    target=_background_process_providers,
-                    args=(order_id, api_jobs),
-                    daemon=True,
-                )
-                t.start()
+                _BG_POOL.submit(_background_process_providers, order_id, api_jobs).add_done_callback(_log_bg_failure)
             except Exception as e:
-                jlog("checkout_bg_spawn_error", order_id=order_id, error=str(e))
-
-        msg = (
-            "📝 Order received and is processing. "
-            "We’ve charged your wallet. Order ID: {oid}"
-        ).format(oid=order_id)
-
-        return (
-            jsonify(
-                {
-                    "success": True,
-                    "message": msg,
-                    "order_id": order_id,
-                    "redirect_url": f"/invoice/{order_id}",  # frontend already uses this
-                    "status": status,
-                    "charged_amount": total_to_charge_now,
-                    "profit_amount_total": round(profit_amount_total, 2),
-                    "processing_count": processing_count,
-                    "skipped_count": skipped_count,
-                    "items": results,
-                }
+                jlog_async("checkout_bg_spawn_error", order_id=order_id, error=str(e))
+
+        return Response(
+            _TMPL_PROCESSING % (
+                orjson.dumps(_MSG_PROCESSING % order_id),
+                orjson.dumps(order_id),
+                orjson.dumps(f"/invoice/{order_id}"),  # frontend already uses redirect_url
+                orjson.dumps(status),
+                orjson.dumps(total_to_charge_now),
+                orjson.dumps(profit_amount_total),
+                processing_count,
+                skipped_count,
+                orjson.dumps(results),
             ),
-            200,
+            status=200,
+            mimetype="application/json",
         )
 
-    except Exception:
-        jlog("checkout_uncaught", error=traceback.format_exc())
-        return jsonify({"success": False, "message": "Server error"}), 500
+    except Exception as e:
+        _log_uncaught("checkout_uncaught", e)
+        # A fresh Response each time: after_request hooks (session cookie refresh) mutate headers
+        return Response(
+            _SERVER_ERROR_BODY, status=500, mimetype="application/json", headers=_SERVER_ERROR_HEADERS
+        )
 
 
 # ===== Invoice view (same blueprint) =========================================
@@ -1305,7 +1674,7 @@ def invoice_view(order_id):
     Render a single invoice by Nagonu Order ID (e.g. NAN12345)
     Uses invoice.html template you already created.
     """
-    order = orders_col.find_one({"order_id": order_id})
+    order = orders_col.find_one({"order_id": order_id}, {"debug": 0})  # debug events are never rendered
     if not order:
         abort(404)
 
@@ -1313,7 +1682,7 @@ def invoice_view(order_id):
     try:
         uid = order.get("user_id")
         if uid:
-            user = users_col.find_one({"_id": uid}) or {}
+            user = users_col.find_one({"_id": uid}, {"name": 1, "full_name": 1, "username": 1}) or {}
     except Exception:
         user = {}
 
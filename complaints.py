@@ -3,7 +3,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from bson.objectid import ObjectId
 from datetime import datetime
 from werkzeug.utils import secure_filename
-import os, time, uuid
+import os, time, uuid, hashlib
 
 from db import db
 
@@ -11,35 +11,69 @@ complaints_bp = Blueprint("complaints", __name__)
 orders_col = db["orders"]
 complaints_col = db["complaints"]
 
+# ---- Optional indexes (run once on import) ----
+try:
+    # view_complaints: user's complaints newest first, with or without a status filter
+    complaints_col.create_index([("user_id", 1), ("status", 1), ("submitted_at", -1)], name="user_status_time_idx")
+    complaints_col.create_index([("user_id", 1), ("submitted_at", -1)], name="user_time_idx")
+except Exception:
+    # Index creation failures shouldn't crash the app
+    pass
+
+VIEW_COMPLAINTS_LIMIT = 200
+
+# Only what submit_complaint reads: the first line item and a few top-level refs
+ORDER_COMPLAINT_PROJECTION = {"items": {"$slice": 1}, "order_no": 1, "order_id": 1, "created_at": 1}
+
 # === Uploads ===
 UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 ALLOWED_IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
 MAX_IMAGE_MB = 8  # hard cap per file
+# Whole complaint POST: two screenshots plus a little room for the other form fields.
+# Werkzeug enforces it while reading the body, so oversized uploads are never buffered.
+MAX_COMPLAINT_BODY = (2 * MAX_IMAGE_MB + 1) * 1024 * 1024
 
 def _allowed_image(filename: str) -> bool:
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
-
-def _filesize_ok(f) -> bool:
-    # Some servers won’t populate content_length reliably for in‑memory streams; this guards typical cases.
-    try:
-        f.stream.seek(0, os.SEEK_END)
-        size = f.stream.tell()
-        f.stream.seek(0)
-        return size <= MAX_IMAGE_MB * 1024 * 1024
-    except Exception:
-        # If we can’t measure, allow and rely on server’s MAX_CONTENT_LENGTH if set
-        return True
+    _, dot, ext = filename.rpartition(".")
+    return bool(dot) and ext.lower() in ALLOWED_IMAGE_EXTENSIONS
 
-def _save_image(file_storage, prefix: str) -> str:
-    """Save image to uploads/ with a unique name; returns web path like /uploads/xxx.jpg"""
+def _save_image(file_storage, prefix: str):
+    """
+    Stream image to uploads/ with a unique name, hashing it on the way through.
+    Returns (web path like /uploads/xxx.jpg, sha256 hex), or (None, None) if the
+    file is over MAX_IMAGE_MB (the partial file is removed).
+    """
     original = secure_filename(file_storage.filename or "")
-    ext = original.rsplit(".", 1)[1].lower() if "." in original else "jpg"
+    _, dot, ext = original.rpartition(".")
+    ext = (ext.lower() if dot else "") or "jpg"
     unique_name = f"{prefix}_{int(time.time())}_{uuid.uuid4().hex[:10]}.{ext}"
     fullpath = os.path.join(UPLOAD_FOLDER, unique_name)
-    file_storage.save(fullpath)
-    return f"/uploads/{unique_name}"
+
+    limit = MAX_IMAGE_MB * 1024 * 1024
+    size = 0
+    h = hashlib.sha256()
+    with open(fullpath, "wb") as out:
+        while True:
+            chunk = file_storage.stream.read(1 << 16)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > limit:
+                break
+            h.update(chunk)
+            out.write(chunk)
+    if size > limit:
+        _discard_image(f"/uploads/{unique_name}")
+        return None, None
+    return f"/uploads/{unique_name}", h.hexdigest()
+
+def _discard_image(web_path: str):
+    try:
+        os.remove(os.path.join(UPLOAD_FOLDER, os.path.basename(web_path)))
+    except OSError:
+        pass
 
 def _try_objectid(s: str):
     try:
@@ -50,16 +84,26 @@ def _try_objectid(s: str):
 def _find_order_for_user(user_id: ObjectId, order_number: str):
     """
     Attempts to find an order for this user by common identifiers:
-    - order_no
-    - order_id
-    - _id (ObjectId string)
+    - order_lookup_keys (order_id + _id string, written by checkout; one index probe)
+    - order_no / order_id / _id (ObjectId string) for orders written without lookup keys
     """
+    order = orders_col.find_one(
+        {"user_id": user_id, "order_lookup_keys": order_number}, ORDER_COMPLAINT_PROJECTION
+    )
+    if order:
+        return order
+
     oid = _try_objectid(order_number)
     query = {
-        "user_id": ObjectId(user_id),
+        "user_id": user_id,
         "$or": [{"order_no": order_number}, {"order_id": order_number}] + ([{"_id": oid}] if oid else [])
     }
-    return orders_col.find_one(query)
+    return orders_col.find_one(query, ORDER_COMPLAINT_PROJECTION)
+
+@complaints_bp.errorhandler(413)
+def _complaint_too_large(e):
+    flash(f"Your screenshots are too large (max {MAX_IMAGE_MB}MB each).", "danger")
+    return redirect(url_for("complaints.submit_complaint"))
 
 @complaints_bp.route("/complaints", methods=["GET", "POST"])
 def submit_complaint():
@@ -75,6 +119,8 @@ def submit_complaint():
         return redirect(url_for("login.login"))
 
     if request.method == "POST":
+        request.max_content_length = MAX_COMPLAINT_BODY  # checked before the form is parsed
+        uid_obj = ObjectId(user_id)
         order_number = (request.form.get("order_number") or "").strip()
         file_balance = request.files.get("screenshot_balance")
         file_msisdn = request.files.get("screenshot_msisdn")
@@ -97,12 +143,9 @@ def submit_complaint():
             if not _allowed_image(f.filename):
                 flash(f"Invalid {field_name} image type. Allowed: {', '.join(sorted(ALLOWED_IMAGE_EXTENSIONS))}.", "danger")
                 return redirect(url_for("complaints.submit_complaint"))
-            if not _filesize_ok(f):
-                flash(f"The {field_name} screenshot is too large (>{MAX_IMAGE_MB}MB).", "danger")
-                return redirect(url_for("complaints.submit_complaint"))
 
         # --- Find order for this user ---
-        order = _find_order_for_user(ObjectId(user_id), order_number)
+        order = _find_order_for_user(uid_obj, order_number)
         if not order or not order.get("items"):
             flash("We couldn't find that order for your account.", "danger")
             return redirect(url_for("complaints.submit_complaint"))
@@ -113,12 +156,17 @@ def submit_complaint():
         offer = item.get("value")
         created_at = order.get("created_at")
 
-        # --- Save images ---
-        balance_path = _save_image(file_balance, "balance")
-        msisdn_path = _save_image(file_msisdn, "msisdn")
+        # --- Save images (size cap + sha256 in the same pass) ---
+        balance_path, balance_sha = _save_image(file_balance, "balance")
+        msisdn_path, msisdn_sha = _save_image(file_msisdn, "msisdn") if balance_path else (None, None)
+        if not balance_path or not msisdn_path:
+            if balance_path:
+                _discard_image(balance_path)
+            flash(f"Your screenshots are too large (max {MAX_IMAGE_MB}MB each).", "danger")
+            return redirect(url_for("complaints.submit_complaint"))
 
         complaint_doc = {
-            "user_id": ObjectId(user_id),
+            "user_id": uid_obj,
             "order_ref": {
                 # Keep flexible keys to match whatever you store on orders
                 "_id": order.get("_id"),
@@ -133,6 +181,11 @@ def submit_complaint():
                 "data_balance": balance_path,
                 "phone_msisdn": msisdn_path,
             },
+            # sha256 of each screenshot, for spotting re-submitted images
+            "screenshot_hashes": {
+                "data_balance": balance_sha,
+                "phone_msisdn": msisdn_sha,
+            },
             "submitted_at": datetime.utcnow(),
             "status": "pending",
         }
@@ -156,7 +209,8 @@ def view_complaints():
     start_date = (request.args.get("start_date") or "").strip()
     end_date = (request.args.get("end_date") or "").strip()
 
-    query = {"user_id": ObjectId(user_id)}
+    uid_obj = ObjectId(user_id)
+    query = {"user_id": uid_obj}
 
     if status_filter:
         query["status"] = status_filter
@@ -178,7 +232,7 @@ def view_complaints():
     if date_cond:
         query["submitted_at"] = date_cond
 
-    complaints = list(complaints_col.find(query).sort("submitted_at", -1))
+    complaints = list(complaints_col.find(query).sort("submitted_at", -1).limit(VIEW_COMPLAINTS_LIMIT))
     return render_template(
         "view_complaints.html",
         complaints=complaints,
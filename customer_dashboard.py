@@ -1,8 +1,12 @@
-from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify
+from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify, g
 from bson import ObjectId
 from db import db
-import json, ast, re
+import os, ast, re, threading, time, atexit
+import orjson
 from datetime import datetime, date, timedelta
+from functools import lru_cache
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Any, Dict, List, Tuple  # add Tuple for 3.8/3.9
 
 customer_dashboard_bp = Blueprint("customer_dashboard", __name__)
@@ -20,17 +24,39 @@ afa_settings_col     = db["afa_settings"]      # primary AFA settings (price/ope
 afa_col              = db["afa_registrations"] # AFA registrations
 balance_logs_col     = db["balance_logs"]      # wallet logs
 
+# ---- Optional indexes (run once on import) ----
+try:
+    # overrides are upserted per (service, customer); fall back to a plain index if old duplicates exist
+    try:
+        service_profits_col.create_index([("customer_id", 1), ("service_id", 1)], unique=True)
+    except Exception:
+        service_profits_col.create_index([("customer_id", 1), ("service_id", 1)])
+    try:
+        balances_col.create_index("user_id", unique=True)
+    except Exception:
+        balances_col.create_index("user_id")
+    orders_col.create_index([("user_id", 1), ("created_at", -1)])
+except Exception:
+    # Index creation failures shouldn't crash the app
+    pass
+
 # ---------- helpers ----------
 _NUM = re.compile(r"^\s*-?\d+(\.\d+)?\s*$", re.IGNORECASE)
-_GB  = re.compile(r"(\d+(?:\.\d+)?)[\s]*G(?:B|IG)?\b", re.IGNORECASE)
-_MB  = re.compile(r"(\d+(?:\.\d+)?)[\s]*MB\b", re.IGNORECASE)
-_MIN = re.compile(r"(\d+(?:\.\d+)?)[\s]*(?:MIN|MINS|MINUTE|MINUTES)\b", re.IGNORECASE)
+# one pass finds every "<number> GB|MB|MIN" figure; the named group says which unit matched
+_VOL = re.compile(
+    r"(\d+(?:\.\d+)?)[\s]*(?:(?P<gb>G(?:B|IG)?)|(?P<mb>MB)|(?P<min>MIN|MINS|MINUTE|MINUTES))\b",
+    re.IGNORECASE,
+)
 _PKG_TAIL = re.compile(r"\s*\(Pkg\s*\d+\)\s*$", re.IGNORECASE)
-_mapping_like = re.compile(r"^\s*\{.*\}\s*$", re.DOTALL)
 
 def _now() -> datetime:
     return datetime.utcnow()
 
+@lru_cache(maxsize=4096)
+def _oid(s: str) -> ObjectId:
+    """ObjectId(s), parsed once per distinct id string; raises like ObjectId on bad input."""
+    return ObjectId(s)
+
 def _to_float(x: Any) -> Optional[float]:
     """
     Safely convert numbers, Mongo Extended JSON (e.g. {'$numberDouble':'15.0'}),
@@ -74,9 +100,32 @@ def _format_volume_unit(value: Optional[float], unit: str) -> str:
     # default 'data': MB
     if v >= 1000:
         gb = v / 1000.0
-        return f"{int(gb)}GB" if abs(gb - int(gb)) < 1e-9 else f"{gb:.2f}GB"
+        return f"{int(gb)}GB" if gb.is_integer() else f"{gb:.2f}GB"
     return f"{int(v)}MB"
 
+@lru_cache(maxsize=1024)
+def _parse_value_str(vt: str) -> Any:
+    """Parse a stripped "{...}" value string once; callers copy dict results."""
+    # JSON first, then the usual single-quoted "{'id': 50, 'volume': 20000}" read as JSON.
+    # The quote swap is only safe when every ' is a delimiter: with a " or a \ in the
+    # string an apostrophe may be data (it\'s), so those go straight to literal_eval
+    candidates = (vt,) if ('"' in vt or "\\" in vt) else (vt, vt.replace("'", '"'))
+    for candidate in candidates:
+        try:
+            data = orjson.loads(candidate)
+            if isinstance(data, dict):
+                return data
+        except orjson.JSONDecodeError:
+            continue
+    # then tolerant Python-literal (True/None, int keys, mixed quoting)
+    try:
+        data = ast.literal_eval(vt)
+        if isinstance(data, dict):
+            return data
+    except Exception:
+        pass
+    return vt
+
 def _parse_value_field(value: Any) -> Any:
     """
     Accepts:
@@ -90,24 +139,38 @@ def _parse_value_field(value: Any) -> Any:
         return value
     if isinstance(value, str):
         vt = value.strip()
-        if vt.startswith("{") and vt.endswith("}"):
-            # try JSON first
-            try:
-                data = json.loads(vt)
-                if isinstance(data, dict):
-                    return data
-            except Exception:
-                # then tolerant Python-literal
-                try:
-                    if _mapping_like.match(vt):
-                        data = ast.literal_eval(vt)
-                        if isinstance(data, dict):
-                            return data
-                except Exception:
-                    pass
-        return vt
+        if not (vt.startswith("{") and vt.endswith("}")):
+            return vt  # "1GB", "GHS 160 — 1GB (Pkg 2)", ...
+        parsed = _parse_value_str(vt)
+        # the cached dict is shared; hand out a copy
+        return dict(parsed) if isinstance(parsed, dict) else parsed
     return value
 
+@lru_cache(maxsize=4096)
+def _scan_volume(s: str, unit: str) -> Optional[float]:
+    """
+    Minutes: first MIN figure. Data: first GB figure (as MB), else first MB figure.
+    """
+    if unit != "minutes":
+        # common "<number>GB" / "<number> MB" shape: plain str ops, no regex
+        t = s.strip()
+        tail = t[-2:].upper()
+        if tail == "GB" or tail == "MB":
+            num = t[:-2].rstrip()
+            whole, dot, frac = num.partition(".")
+            if whole.isdecimal() and (not dot or frac.isdecimal()):
+                return float(num) * 1000.0 if tail == "GB" else float(num)
+    mb = None
+    for m in _VOL.finditer(s):
+        if unit == "minutes":
+            if m.group("min"):
+                return float(m.group(1))
+        elif m.group("gb"):
+            return float(m.group(1)) * 1000.0
+        elif mb is None and m.group("mb"):
+            mb = float(m.group(1))
+    return mb
+
 def _extract_volume(value: Any, unit: str) -> Optional[float]:
     """Return numeric volume for sorting (MB for data, minutes for talktime)."""
     if isinstance(value, dict):
@@ -117,55 +180,23 @@ def _extract_volume(value: Any, unit: str) -> Optional[float]:
         if isinstance(vol, (int, float)) or (_NUM.match(str(vol))):
             return float(vol)
         # textual volume
-        vol_s = str(vol)
-        if unit == "minutes":
-            m = _MIN.search(vol_s)
-            if m:
-                return float(m.group(1))
-            if _NUM.match(vol_s):
-                return float(vol_s)
-            return None
-        else:
-            m = _GB.search(vol_s)
-            if m:
-                return float(m.group(1)) * 1000.0
-            m = _MB.search(vol_s)
-            if m:
-                return float(m.group(1))
-            if _NUM.match(vol_s):
-                return float(vol_s)  # assume MB
-            return None
+        return _scan_volume(str(vol), unit)
 
     if isinstance(value, str):
-        s = value
-        if unit == "minutes":
-            m = _MIN.search(s)
-            if m:
-                return float(m.group(1))
-            if _NUM.match(s):
-                return float(s)
-            s2 = _PKG_TAIL.sub("", s)
-            m = _MIN.search(s2)
-            if m:
-                return float(m.group(1))
-            return None
-        else:
-            m = _GB.search(s)
-            if m:
-                return float(m.group(1)) * 1000.0
-            m = _MB.search(s)
-            if m:
-                return float(m.group(1))
-            s2 = _PKG_TAIL.sub("", s)
-            m = _GB.search(s2)
-            if m:
-                return float(m.group(1)) * 1000.0
-            m = _MB.search(s2)
-            if m:
-                return float(m.group(1))
-            if _NUM.match(s2):
-                return float(s2)  # assume MB
-            return None
+        return _extract_volume_str(value, unit)
+    return None
+
+@lru_cache(maxsize=8192)
+def _extract_volume_str(s: str, unit: str) -> Optional[float]:
+    """String branch of _extract_volume; offer strings repeat across services and refreshes."""
+    vol = _scan_volume(s, unit)
+    if vol is not None:
+        return vol
+    if unit == "minutes":
+        return float(s) if _NUM.match(s) else None
+    s2 = _PKG_TAIL.sub("", s)
+    if _NUM.match(s2):
+        return float(s2)  # assume MB
     return None
 
 def _value_text_for_display(value: Any, unit: str) -> str:
@@ -181,22 +212,47 @@ def _value_text_for_display(value: Any, unit: str) -> str:
 def _get_service_default_profit(service_doc: Dict[str, Any]) -> float:
     return _to_float(service_doc.get("default_profit_percent")) or 0.0
 
-def _get_customer_profit_override(service_id: ObjectId, customer_id_obj: ObjectId) -> Optional[float]:
-    ov = service_profits_col.find_one({"service_id": service_id, "customer_id": customer_id_obj})
-    return _to_float(ov.get("profit_percent")) if ov else None
+# per-customer override maps, reused for a short TTL across dashboard renders;
+# admin_services drops entries when it changes an override (this process only)
+PROFIT_OVERRIDE_TTL = float(os.getenv("DASHBOARD_OVERRIDE_TTL", "60") or 60)
+_OVERRIDE_CACHE_MAX = 4096
+_override_cache: Dict[ObjectId, Tuple[float, Dict[ObjectId, Optional[float]]]] = {}
 
-def _effective_profit_percent(service_doc: Dict[str, Any], customer_id_obj: ObjectId) -> float:
-    override = _get_customer_profit_override(service_doc["_id"], customer_id_obj)
-    return override if override is not None else _get_service_default_profit(service_doc)
+def _load_customer_profit_overrides(customer_id_obj: ObjectId) -> Dict[ObjectId, Optional[float]]:
+    """
+    Every per-customer override in one query, cached for PROFIT_OVERRIDE_TTL seconds.
+    Returns {service_id: profit_percent or None}; services without an override are absent.
+    """
+    now = time.monotonic()
+    hit = _override_cache.get(customer_id_obj)
+    if hit is not None and now - hit[0] < PROFIT_OVERRIDE_TTL:
+        return hit[1]
+    overrides: Dict[ObjectId, Optional[float]] = {}
+    for ov in service_profits_col.find(
+        {"customer_id": customer_id_obj},
+        {"service_id": 1, "profit_percent": 1},
+    ):
+        # first match wins, same as the old per-service find_one
+        overrides.setdefault(ov.get("service_id"), _to_float(ov.get("profit_percent")))
+    if len(_override_cache) >= _OVERRIDE_CACHE_MAX:
+        _override_cache.clear()
+    _override_cache[customer_id_obj] = (now, overrides)
+    return overrides
+
+def invalidate_customer_profit_overrides(customer_id_obj: Optional[ObjectId] = None) -> None:
+    """Forget cached overrides for one customer, or for everyone when no id is given."""
+    if customer_id_obj is None:
+        _override_cache.clear()
+    else:
+        _override_cache.pop(customer_id_obj, None)
 
-def _price_with_profit(amount: Optional[float], profit_percent: Optional[float]) -> Optional[float]:
-    a = _to_float(amount)
-    p = _to_float(profit_percent) or 0.0
-    if a is None:
-        return None
-    return round(a + (a * (p / 100.0)), 2)
+def _effective_profit_percent(service_doc: Dict[str, Any], overrides: Dict[ObjectId, Optional[float]]) -> float:
+    override = overrides.get(service_doc["_id"])
+    return override if override is not None else _get_service_default_profit(service_doc)
 
 # ---- service ordering ----
+_INF = float("inf")        # sorts missing priority/order/volume last
+_UNRANKED = 10_000         # names not in PREFERRED_ORDER
 PREFERRED_ORDER: List[str] = [
     "MTN",
     "AT - iShare",
@@ -204,19 +260,18 @@ PREFERRED_ORDER: List[str] = [
     "AFA TALKTIME",
 ]
 
+@lru_cache(maxsize=1024)
 def _norm(s: str) -> str:
     return (s or "").strip().lower()
 
+# normalized (whitespace-collapsed) preferred name -> rank
+_PREFERRED_RANK: Dict[str, int] = {
+    " ".join(_norm(want).split()): i for i, want in reversed(list(enumerate(PREFERRED_ORDER)))
+}  # reversed so the first entry wins if two names normalize alike
+
+@lru_cache(maxsize=256)
 def _name_rank(name: str) -> Optional[int]:
-    n = _norm(name)
-    for i, want in enumerate(PREFERRED_ORDER):
-        if _norm(want) == n:
-            return i
-    n2 = " ".join(n.split())
-    for i, want in enumerate(PREFERRED_ORDER):
-        if " ".join(_norm(want).split()) == n2:
-            return i
-    return None
+    return _PREFERRED_RANK.get(" ".join(_norm(name).split()))
 
 def _created_ts(service_doc: Dict[str, Any]) -> float:
     ca = service_doc.get("created_at")
@@ -232,15 +287,130 @@ def _created_ts(service_doc: Dict[str, Any]) -> float:
 
 def _service_priority_tuple(svc: Dict[str, Any]):
     prio = _to_float(svc.get("priority"))
-    prio = prio if prio is not None else float("inf")
     name = svc.get("name") or ""
     nrank = _name_rank(name)
-    nrank = nrank if nrank is not None else 10_000
     display_order = _to_float(svc.get("display_order"))
-    display_order = display_order if display_order is not None else float("inf")
-    ts = -_created_ts(svc)
-    alpha = _norm(name)
-    return (prio, nrank, display_order, ts, alpha)
+    return (
+        prio if prio is not None else _INF,
+        nrank if nrank is not None else _UNRANKED,
+        display_order if display_order is not None else _INF,
+        -_created_ts(svc),
+        _norm(name),
+    )
+
+# ---- services cache ----------------------------------------------------------
+# Services change rarely (admin edits), but every dashboard hit used to fetch and
+# re-parse all of them. Keep the parsed, sorted list per process for a short TTL;
+# only the customer-specific profit is applied per request.
+SERVICES_CACHE_TTL = float(os.getenv("DASHBOARD_SERVICES_TTL", "30") or 30)
+_svc_cache: Dict[str, Any] = {"ts": 0.0, "data": None}
+_svc_cache_lock = threading.Lock()
+SERVICES_BATCH_SIZE = 50
+
+# fields read by _prepare_service, the sort key, the express split and the template
+SERVICE_DASHBOARD_PROJECTION = {
+    "name": 1, "image_url": 1, "offers": 1, "unit": 1, "type": 1,
+    "status": 1, "availability": 1, "closed_message": 1, "out_of_stock_message": 1,
+    "default_profit_percent": 1, "priority": 1, "display_order": 1, "created_at": 1,
+    "service_category": 1, "category": 1,
+}
+# recent orders table: id, first line's service name, line count, total, status, date
+RECENT_ORDER_PROJECTION = {
+    "order_id": 1, "items.serviceName": 1, "total_amount": 1, "status": 1, "created_at": 1,
+}
+
+def _prepare_service(s: Dict[str, Any]) -> Dict[str, Any]:
+    """Everything about a service row that does not depend on the customer."""
+    s["_id_str"] = str(s["_id"])
+
+    # attach flags/state for UI
+    st = _service_state(s)
+    s.update(st)  # type, status, availability, can_order, disabled_reason, messages
+
+    unit = _service_unit(s)  # minutes for AFA TALKTIME, data otherwise
+    offers = s.get("offers") or []
+
+    # (sort key, offer) pairs, so the offer dicts never carry sort-only fields
+    keyed_offers: List[Tuple[Tuple[float, float], Dict[str, Any]]] = []
+    for of in offers:
+        parsed_value = _parse_value_field(of.get("value"))
+        if of.get("dash_value_text") and of.get("dash_unit") == unit:
+            # denormalized by migrate_offer_display_fields.py; admin edits drop these keys
+            vol_num = _to_float(of.get("dash_sort_vol"))
+            value_text = of["dash_value_text"]
+        else:
+            vol_num = _extract_volume(parsed_value, unit)  # for sorting
+            value_text = _value_text_for_display(parsed_value, unit)
+        amount = _to_float(of.get("amount"))
+        legacy_profit = of.get("profit")  # admin saves None; only old offers carry a value
+
+        keyed_offers.append((
+            (vol_num if vol_num is not None else _INF, amount if amount is not None else _INF),
+            {
+                "amount": amount,
+                "value": parsed_value,
+                "value_text": value_text,
+                "legacy_profit": _to_float(legacy_profit) if legacy_profit is not None else None,
+            },
+        ))
+
+    # sort by volume asc, then amount asc (stable; the dicts themselves are never compared)
+    keyed_offers.sort(key=itemgetter(0))
+    s["offers"] = [o for _, o in keyed_offers]
+    s["unit"] = unit
+    s["_priced"] = {}  # profit percent -> offers with totals, see _priced_offers
+    return s
+
+def _priced_offers(cached: Dict[str, Any], eff_profit: float) -> List[Dict[str, Any]]:
+    """
+    Offers with customer totals for one profit percent. Most customers share the
+    service default, so the list is memoized on the cached row (a few entries per service).
+    """
+    memo = cached["_priced"]
+    priced = memo.get(eff_profit)
+    if priced is None:
+        # total = a + a * (p / 100), with p / 100 hoisted out of the loop;
+        # amounts are already floats from _prepare_service
+        pct = (eff_profit or 0.0) / 100.0
+        priced = [
+            dict(
+                of,
+                profit_percent_used=eff_profit,
+                total=round(of["amount"] + (of["amount"] * pct), 2) if of["amount"] is not None else None,
+            )
+            for of in cached["offers"]
+        ]
+        if len(memo) < 32:
+            memo[eff_profit] = priced
+    return priced
+
+def _load_dashboard_services() -> List[Dict[str, Any]]:
+    """
+    Sorted, offer-normalized services shared by all customers.
+    Callers must copy a row before adding per-customer fields.
+    """
+    now = time.monotonic()
+    data = _svc_cache["data"]
+    if data is not None and now - _svc_cache["ts"] < SERVICES_CACHE_TTL:
+        return data
+    with _svc_cache_lock:
+        # another thread may have refreshed while we waited
+        if _svc_cache["data"] is not None and time.monotonic() - _svc_cache["ts"] < SERVICES_CACHE_TTL:
+            return _svc_cache["data"]
+        # prepare each service as its batch arrives; the sort key only reads
+        # priority/name/display_order/created_at, which _prepare_service leaves alone
+        cursor = services_col.find({}, SERVICE_DASHBOARD_PROJECTION).batch_size(SERVICES_BATCH_SIZE)
+        data = [_prepare_service(s) for s in cursor]
+        data.sort(key=_service_priority_tuple)
+        _svc_cache["data"] = data
+        _svc_cache["ts"] = time.monotonic()
+        return data
+
+def invalidate_dashboard_services() -> None:
+    """Drop the cached services list so the next dashboard load re-reads it (call after any service write)."""
+    with _svc_cache_lock:
+        _svc_cache["data"] = None
+        _svc_cache["ts"] = 0.0
 
 def _display_name(user_doc: Optional[Dict[str, Any]]) -> str:
     if not user_doc:
@@ -334,6 +504,19 @@ def _load_afa_settings() -> Dict[str, Any]:
     # IMPORTANT: No reflection from 'AFA TALKTIME' or any other service.
     return defaults
 
+# display-only copy for the dashboard; the register API reads settings fresh before charging
+AFA_SETTINGS_TTL = 5.0
+_afa_cache: Dict[str, Any] = {"ts": 0.0, "data": None}
+
+def _load_afa_settings_cached() -> Dict[str, Any]:
+    data = _afa_cache["data"]
+    now = time.monotonic()
+    if data is None or now - _afa_cache["ts"] >= AFA_SETTINGS_TTL:
+        data = _load_afa_settings()
+        _afa_cache["data"] = data
+        _afa_cache["ts"] = now
+    return dict(data)
+
 # ---------- NEW: customer daily sales (today + last 5) ----------
 
 def _day_range(d: date) -> Tuple[datetime, datetime]:
@@ -417,6 +600,107 @@ def compute_user_daily_sales(user_oid: ObjectId, days_back: int = 6) -> Dict[str
         "statement": statement,
     }
 
+# ---------- dashboard query pool ----------
+# The dashboard's independent reads (balance, orders, stores, AFA, sales) run
+# side by side so a render waits for the slowest query, not their sum.
+DASH_QUERY_WORKERS = 16
+_DASH_POOL = ThreadPoolExecutor(max_workers=DASH_QUERY_WORKERS, thread_name_prefix="dash-query")
+atexit.register(_DASH_POOL.shutdown, wait=False)
+
+def _recent_orders(user_oid: ObjectId) -> List[Dict[str, Any]]:
+    return list(
+        orders_col.find({"user_id": user_oid}, RECENT_ORDER_PROJECTION)
+        .sort("created_at", -1)
+        .limit(5)
+    )
+
+# ---------- per-request customer docs ----------
+# The dashboard route and the context processor below need the same user and
+# balance docs; fetch each once per request and keep it on flask.g.
+_DISPLAY_NAME_PROJECTION = {
+    "full_name": 1, "name": 1, "first_name": 1, "last_name": 1, "username": 1, "email": 1
+}
+
+def _request_user_doc(uid: ObjectId) -> Optional[Dict[str, Any]]:
+    if "customer_user_doc" not in g:
+        g.customer_user_doc = users_col.find_one({"_id": uid}, _DISPLAY_NAME_PROJECTION)
+    return g.customer_user_doc
+
+def _request_balance_doc(uid: ObjectId) -> Optional[Dict[str, Any]]:
+    if "customer_balance_doc" not in g:
+        g.customer_balance_doc = balances_col.find_one({"user_id": uid}, {"amount": 1})
+    return g.customer_balance_doc
+
+# ---------- store owner summary (payouts + store orders) ----------
+
+def _load_store_summary(user_oid: ObjectId) -> Tuple[float, List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Outstanding payouts across the customer's stores plus their store orders
+    (raw and display rows). Best effort: any failure yields empty results.
+    """
+    outstanding_payouts = 0.0
+    store_slugs: List[str] = []
+    store_recent_orders: List[Dict[str, Any]] = []
+    store_recent_orders_view: List[Dict[str, Any]] = []
+    try:
+        store_slugs = [
+            s.get("slug")
+            for s in stores_col.find(
+                {"owner_id": user_oid, "status": {"$ne": "deleted"}},
+                {"slug": 1}
+            )
+            if s.get("slug")
+        ]
+        if store_slugs:
+            pipeline = [
+                {"$match": {"store_slug": {"$in": store_slugs}}},
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": {"$toDouble": {"$ifNull": ["$total_profit_balance", 0]}}},
+                }},
+            ]
+            agg = list(store_accounts_col.aggregate(pipeline))
+            if agg:
+                outstanding_payouts = _to_float(agg[0].get("total")) or 0.0
+
+            store_recent_orders = list(
+                orders_col.find(
+                    {"store_slug": {"$in": store_slugs}},
+                    {
+                        "order_id": 1,
+                        "store_slug": 1,
+                        "items": 1,
+                        "total_amount": 1,
+                        "status": 1,
+                        "created_at": 1,
+                        "paystack_reference": 1,
+                    }
+                )
+                .sort("created_at", -1)
+            )
+            for od in store_recent_orders:
+                created_at = od.get("created_at")
+                created_iso = created_at.isoformat() if isinstance(created_at, datetime) else ""
+                created_fmt = created_at.strftime("%d %b %Y, %I:%M %p") if isinstance(created_at, datetime) else ""
+                items = od.get("items") or []
+                phone = ""
+                if items and isinstance(items[0], dict):
+                    phone = items[0].get("phone") or ""
+                store_recent_orders_view.append({
+                    "order_id": od.get("order_id"),
+                    "store_slug": od.get("store_slug"),
+                    "phone": phone,
+                    "total_amount": _to_float(od.get("total_amount")) or 0.0,
+                    "status": od.get("status") or "",
+                    "paystack_reference": (od.get("paystack_reference") or "").strip(),
+                    "created_at_iso": created_iso,
+                    "created_at_fmt": created_fmt,
+                })
+    except Exception:
+        pass
+
+    return outstanding_payouts, store_recent_orders, store_recent_orders_view
+
 # ---------- globals ----------
 @customer_dashboard_bp.app_context_processor
 def inject_customer_globals():
@@ -424,13 +708,11 @@ def inject_customer_globals():
     uname = session.get("username")
     try:
         if session.get("role") == "customer" and session.get("user_id"):
-            uid = ObjectId(session["user_id"])
-            bal_doc = balances_col.find_one({"user_id": uid})
+            uid = _oid(session["user_id"])
+            bal_doc = _request_balance_doc(uid)
             if bal_doc and bal_doc.get("amount") is not None:
                 bal = float(bal_doc["amount"])
-            user_doc = users_col.find_one({"_id": uid}, {
-                "full_name": 1, "name": 1, "first_name": 1, "last_name": 1, "username": 1, "email": 1
-            })
+            user_doc = _request_user_doc(uid)
             uname = _display_name(user_doc)
     except Exception:
         pass
@@ -443,7 +725,7 @@ def api_afa_register():
     if session.get("role") != "customer" or not session.get("user_id"):
         return jsonify(success=False, error="Unauthorized"), 401
 
-    user_oid = ObjectId(session["user_id"])
+    user_oid = _oid(session["user_id"])
 
     payload = request.get_json(silent=True) or {}
     name       = (payload.get("name") or "").strip()
@@ -539,130 +821,43 @@ def customer_dashboard():
     user_id = session.get("user_id")
     if not user_id:
         return redirect(url_for("login.login"))
-    user_oid = ObjectId(user_id)
-
-    # user doc
-    user_doc = users_col.find_one({"_id": user_oid}, {
-        "full_name": 1, "name": 1, "first_name": 1, "last_name": 1, "username": 1, "email": 1
-    })
-    customer_name = _display_name(user_doc)
+    user_oid = _oid(user_id)
 
-    # services (sorted)
-    raw_services = list(services_col.find({}))
-    raw_services.sort(key=_service_priority_tuple)
+    # independent reads, started now and collected below
+    f_balance = _DASH_POOL.submit(balances_col.find_one, {"user_id": user_oid}, {"amount": 1})
+    f_recent = _DASH_POOL.submit(_recent_orders, user_oid)
+    f_stores = _DASH_POOL.submit(_load_store_summary, user_oid)
+    f_afa = _DASH_POOL.submit(_load_afa_settings_cached)
+    f_sales = _DASH_POOL.submit(compute_user_daily_sales, user_oid, 6)
 
-    services: List[Dict[str, Any]] = []
-    for s in raw_services:
-        s["_id_str"] = str(s["_id"])
-        eff_profit = _effective_profit_percent(s, user_oid)
+    # user doc (shared with inject_customer_globals for this request)
+    user_doc = _request_user_doc(user_oid)
+    customer_name = _display_name(user_doc)
 
-        # attach flags/state for UI
-        st = _service_state(s)
-        s.update(st)  # type, status, availability, can_order, disabled_reason, messages
+    # services (sorted, offers pre-parsed; shared across requests)
+    cached_services = _load_dashboard_services()
 
-        unit = _service_unit(s)  # minutes for AFA TALKTIME, data otherwise
-        offers = s.get("offers") or []
+    # per-customer overrides, one round trip at most per PROFIT_OVERRIDE_TTL
+    overrides = _load_customer_profit_overrides(user_oid)
 
-        normalized_offers: List[Dict[str, Any]] = []
-        for of in offers:
-            parsed_value = _parse_value_field(of.get("value"))
-            vol_num = _extract_volume(parsed_value, unit)  # for sorting
-            value_text = _value_text_for_display(parsed_value, unit)
-
-            amount = _to_float(of.get("amount"))
-            total = _price_with_profit(amount, eff_profit) if amount is not None else None
-
-            normalized_offers.append({
-                "amount": amount,
-                "value": parsed_value,
-                "value_text": value_text,
-                "legacy_profit": _to_float(of.get("profit")),
-                "profit_percent_used": eff_profit,
-                "total": total,
-                "_sort_vol": vol_num if vol_num is not None else float("inf"),
-                "_sort_amt": amount if amount is not None else float("inf"),
-            })
-
-        # sort by volume asc, then amount asc
-        normalized_offers.sort(key=lambda x: (x["_sort_vol"], x["_sort_amt"]))
-        s["offers"] = [{k: v for k, v in o.items() if not k.startswith("_sort_")} for o in normalized_offers]
+    services: List[Dict[str, Any]] = []
+    for cached in cached_services:
+        s = dict(cached)
+        del s["_priced"]
+        eff_profit = _effective_profit_percent(s, overrides)
+        s["offers"] = _priced_offers(cached, eff_profit)
         s["effective_profit_percent"] = eff_profit
-        s["unit"] = unit
-
         services.append(s)
 
-    # Balance
-    balance_doc = balances_col.find_one({"user_id": user_oid})
+    # Balance (kept on g for inject_customer_globals)
+    balance_doc = g.customer_balance_doc = f_balance.result()
     balance = float(balance_doc["amount"]) if (balance_doc and balance_doc.get("amount") is not None) else 0.00
 
     # Recent orders
-    recent_orders = list(
-        orders_col.find({"user_id": user_oid})
-        .sort("created_at", -1)
-        .limit(5)
-    )
+    recent_orders = f_recent.result()
 
     # Outstanding payouts + store recent orders
-    outstanding_payouts = 0.0
-    store_slugs: List[str] = []
-    store_recent_orders: List[Dict[str, Any]] = []
-    store_recent_orders_view: List[Dict[str, Any]] = []
-    try:
-        store_slugs = [
-            s.get("slug")
-            for s in stores_col.find(
-                {"owner_id": user_oid, "status": {"$ne": "deleted"}},
-                {"slug": 1}
-            )
-            if s.get("slug")
-        ]
-        if store_slugs:
-            pipeline = [
-                {"$match": {"store_slug": {"$in": store_slugs}}},
-                {"$group": {
-                    "_id": None,
-                    "total": {"$sum": {"$toDouble": {"$ifNull": ["$total_profit_balance", 0]}}},
-                }},
-            ]
-            agg = list(store_accounts_col.aggregate(pipeline))
-            if agg:
-                outstanding_payouts = _to_float(agg[0].get("total")) or 0.0
-
-            store_recent_orders = list(
-                orders_col.find(
-                    {"store_slug": {"$in": store_slugs}},
-                    {
-                        "order_id": 1,
-                        "store_slug": 1,
-                        "items": 1,
-                        "total_amount": 1,
-                        "status": 1,
-                        "created_at": 1,
-                        "paystack_reference": 1,
-                    }
-                )
-                .sort("created_at", -1)
-            )
-            for od in store_recent_orders:
-                created_at = od.get("created_at")
-                created_iso = created_at.isoformat() if isinstance(created_at, datetime) else ""
-                created_fmt = created_at.strftime("%d %b %Y, %I:%M %p") if isinstance(created_at, datetime) else ""
-                items = od.get("items") or []
-                phone = ""
-                if items and isinstance(items[0], dict):
-                    phone = items[0].get("phone") or ""
-                store_recent_orders_view.append({
-                    "order_id": od.get("order_id"),
-                    "store_slug": od.get("store_slug"),
-                    "phone": phone,
-                    "total_amount": _to_float(od.get("total_amount")) or 0.0,
-                    "status": od.get("status") or "",
-                    "paystack_reference": (od.get("paystack_reference") or "").strip(),
-                    "created_at_iso": created_iso,
-                    "created_at_fmt": created_fmt,
-                })
-    except Exception:
-        pass
+    outstanding_payouts, store_recent_orders, store_recent_orders_view = f_stores.result()
 
     # ---- split into categories (Express vs others) ----
     def _is_express(svc: Dict[str, Any]) -> bool:
@@ -674,13 +869,13 @@ def customer_dashboard():
     regular_services = [s for s in services if not _is_express(s)]
 
     # AFA settings (price / open / stock) — decoupled from services
-    afa = _load_afa_settings()
+    afa = f_afa.result()
 
     # Affordability for AFA button state on the page
     can_buy_afa = bool(afa["is_open"] and afa["in_stock"] and balance >= float(afa["price"] or 0.0))
 
     # NEW: the customer’s own sales trend (today + last 5 days)
-    ds = compute_user_daily_sales(user_oid, days_back=6)
+    ds = f_sales.result()
 
     return render_template(
         "customer_dashboard.html",
@@ -4,15 +4,33 @@ from __future__ import annotations
 from flask import Blueprint, render_template, request, session, redirect, url_for
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
-import json, ast, re, os
+import os
 
 from db import db
+# offer value parsing / volume display and preferred-name ranking are shared with the
+# customer dashboard so both pages label and order offers the same way
+from customer_dashboard import (
+    _service_unit,
+    _parse_value_field,
+    _extract_volume,
+    _value_text_for_display,
+    _norm,
+    _name_rank,
+)
 
 index_bp = Blueprint("index", __name__)
 
 # --- DB collections ---
 services_col = db["services"]
 
+# fields read by load_services_for_landing and index.html (name/image/description cards)
+LANDING_SERVICE_PROJECTION = {
+    "name": 1, "image_url": 1, "description": 1, "offers": 1, "unit": 1, "type": 1,
+    "status": 1, "availability": 1, "closed_message": 1, "out_of_stock_message": 1,
+    "default_profit_percent": 1, "priority": 1, "display_order": 1, "created_at": 1,
+    "service_category": 1, "category": 1,
+}
+
 # (Optional) still load Paystack public key if your index.html references it in JS
 PAYSTACK_PUBLIC_KEY = os.getenv("PAYSTACK_PUBLIC_KEY", "")
 STORE_PUBLIC_HOST = os.getenv("STORE_PUBLIC_HOST", "nagmart.store").strip().lower()
@@ -34,139 +52,12 @@ def _money(v: Any) -> float:
     except Exception:
         return 0.0
 
-_NUM = re.compile(r"^\s*-?\d+(\.\d+)?\s*$", re.IGNORECASE)
-_GB  = re.compile(r"(\d+(?:\.\d+)?)[\s]*G(?:B|IG)?\b", re.IGNORECASE)
-_MB  = re.compile(r"(\d+(?:\.\d+)?)[\s]*MB\b", re.IGNORECASE)
-_MIN = re.compile(r"(\d+(?:\.\d+)?)[\s]*(?:MIN|MINS|MINUTE|MINUTES)\b", re.IGNORECASE)
-_PKG_TAIL = re.compile(r"\s*\(Pkg\s*\d+\)\s*$", re.IGNORECASE)
-_mapping_like = re.compile(r"^\s*\{.*\}\s*$", re.DOTALL)
-
-def _service_unit(svc: Dict[str, Any]) -> str:
-    unit = (svc.get("unit") or "").strip().lower()
-    name = (svc.get("name") or "").strip().lower()
-    if unit in ("min", "mins", "minute", "minutes"):
-        return "minutes"
-    if name == "afa talktime":
-        return "minutes"
-    return "data"
-
-def _parse_value_field(value: Any) -> Any:
-    if isinstance(value, dict) or value is None:
-        return value
-    if isinstance(value, str):
-        vt = value.strip()
-        if vt.startswith("{") and vt.endswith("}"):
-            try:
-                data = json.loads(vt)
-                if isinstance(data, dict):
-                    return data
-            except Exception:
-                try:
-                    if _mapping_like.match(vt):
-                        data = ast.literal_eval(vt)
-                        if isinstance(data, dict):
-                            return data
-                except Exception:
-                    pass
-        return vt
-    return value
-
-def _extract_volume(value: Any, unit: str) -> Optional[float]:
-    """
-    For unit == 'data' -> we treat volume as MB.
-    For unit == 'minutes' -> we treat volume as minutes.
-    """
-    if isinstance(value, dict):
-        vol = value.get("volume")
-        if vol is None:
-            return None
-        if isinstance(vol, (int, float)) or (_NUM.match(str(vol))):
-            return float(vol)
-        vol_s = str(vol)
-        if unit == "minutes":
-            m = _MIN.search(vol_s)
-            if m: return float(m.group(1))
-            if _NUM.match(vol_s): return float(vol_s)
-            return None
-        else:
-            m = _GB.search(vol_s)
-            if m: return float(m.group(1)) * 1000.0
-            m = _MB.search(vol_s)
-            if m: return float(m.group(1))
-            if _NUM.match(vol_s): return float(vol_s)
-            return None
-
-    if isinstance(value, str):
-        s = value
-        if unit == "minutes":
-            m = _MIN.search(s)
-            if m: return float(m.group(1))
-            if _NUM.match(s): return float(s)
-            s2 = _PKG_TAIL.sub("", s)
-            m = _MIN.search(s2)
-            if m: return float(m.group(1))
-            return None
-        else:
-            m = _GB.search(s)
-            if m: return float(m.group(1)) * 1000.0
-            m = _MB.search(s)
-            if m: return float(m.group(1))
-            s2 = _PKG_TAIL.sub("", s)
-            m = _GB.search(s2)
-            if m: return float(m.group(1)) * 1000.0
-            m = _MB.search(s2)
-            if m: return float(m.group(1))
-            if _NUM.match(s2): return float(s2)
-            return None
-
-    return None
-
-def _format_volume_unit(value: Optional[float], unit: str) -> str:
-    if value is None:
-        return "-"
-    try:
-        v = float(value)
-    except Exception:
-        return "-"
-    if unit == "minutes":
-        return f"{int(round(v))} mins"
-    if v >= 1000:
-        gb = v / 1000.0
-        return f"{int(gb)}GB" if abs(gb - int(gb)) < 1e-9 else f"{gb:.2f}GB"
-    return f"{int(v)}MB"
-
-def _value_text_for_display(value: Any, unit: str) -> str:
-    if isinstance(value, dict):
-        vol = _extract_volume(value, unit)
-        return _format_volume_unit(vol, unit) if vol is not None else "-"
-    if isinstance(value, str):
-        cleaned = _PKG_TAIL.sub("", value).strip()
-        vol = _extract_volume(cleaned, unit)
-        return _format_volume_unit(vol, unit) if vol is not None else (cleaned or "-")
-    return value or "-"
-
-def _norm(s: str) -> str:
-    return (s or "").strip().lower()
-
 def _host_is_store_domain(host: str) -> bool:
     host_only = (host or "").split(":", 1)[0].strip().lower()
     if not STORE_PUBLIC_HOST:
         return False
     return host_only in (STORE_PUBLIC_HOST, f"www.{STORE_PUBLIC_HOST}")
 
-PREFERRED_ORDER: List[str] = ["MTN", "AT - iShare", "AT - BigTime", "AFA TALKTIME"]
-
-def _name_rank(name: str) -> Optional[int]:
-    n = _norm(name)
-    for i, want in enumerate(PREFERRED_ORDER):
-        if _norm(want) == n:
-            return i
-    n2 = " ".join(n.split())
-    for i, want in enumerate(PREFERRED_ORDER):
-        if " ".join(_norm(want).split()) == n2:
-            return i
-    return None
-
 def _created_ts(service_doc: Dict[str, Any]) -> float:
     ca = service_doc.get("created_at")
     if isinstance(ca, datetime):
@@ -228,7 +119,7 @@ def load_services_for_landing() -> Tuple[List[Dict[str, Any]], List[Dict[str, An
     Load all services, normalize offers for display only.
     No wallet, no orders, no external providers.
     """
-    raw = list(services_col.find({}))
+    raw = list(services_col.find({}, LANDING_SERVICE_PROJECTION))
     raw.sort(key=_service_priority_tuple)
 
     services: List[Dict[str, Any]] = []
@@ -270,10 +161,9 @@ def load_services_for_landing() -> Tuple[List[Dict[str, Any]], List[Dict[str, An
             )
 
         normalized_offers.sort(key=lambda x: (x["_sort_vol"], x["_sort_amt"]))
-        s["offers"] = [
-            {k: v for k, v in o.items() if not k.startswith("_sort_")}
-            for o in normalized_offers
-        ]
+        for o in normalized_offers:
+            del o["_sort_vol"], o["_sort_amt"]
+        s["offers"] = normalized_offers
         s["effective_profit_percent"] = eff_profit
         s["unit"] = unit
 
@@ -0,0 +1,49 @@
+"""
+One-off backfill: store each service offer's display text and sort volume
+so the customer dashboard can read them instead of re-parsing offer values.
+
+    python migrate_offer_display_fields.py
+
+The fields are dashboard-only and namespaced (dash_value_text, dash_sort_vol,
+dash_unit): the store page and its scripts prefer an offer's own value_text,
+so that key is never written here. Offers backfilled by the first version of
+this script (value_text + sort_vol + unit) are moved to the dash_* keys.
+
+Safe to re-run; only services with an offer missing dash_value_text are touched.
+Offers saved later from the admin page come without these fields and are
+parsed on read as before.
+"""
+from db import db
+from customer_dashboard import (
+    _parse_value_field,
+    _extract_volume,
+    _value_text_for_display,
+    _service_unit,
+)
+
+services_col = db["services"]
+
+updated = 0
+for svc in services_col.find({"offers": {"$elemMatch": {"dash_value_text": {"$exists": False}}}},
+                             {"name": 1, "unit": 1, "offers": 1}):
+    unit = _service_unit(svc)
+    offers = []
+    for of in svc.get("offers") or []:
+        if not isinstance(of, dict):
+            offers.append(of)
+            continue
+        parsed_value = _parse_value_field(of.get("value"))
+        of = dict(of)
+        if "sort_vol" in of:
+            # written by the first version of this script (admin offers never carry sort_vol)
+            for k in ("value_text", "sort_vol", "unit"):
+                of.pop(k, None)
+        of["dash_value_text"] = _value_text_for_display(parsed_value, unit)
+        of["dash_sort_vol"] = _extract_volume(parsed_value, unit)
+        of["dash_unit"] = unit
+        offers.append(of)
+    # only overwrite if the offers array hasn't changed since we read it
+    res = services_col.update_one({"_id": svc["_id"], "offers": svc.get("offers")}, {"$set": {"offers": offers}})
+    updated += res.modified_count
+
+print(f"✅ Backfilled offer display fields on {updated} service(s).")
@@ -3,7 +3,8 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional, Tuple
-import os, json, re, ast, traceback, threading, uuid
+import os, re, ast, traceback, threading, uuid
+import orjson
 
 import requests
 from bson import ObjectId
@@ -554,7 +555,7 @@ def _parse_value_field(value: Any) -> Any:
         vt = value.strip()
         if vt.startswith("{") and vt.endswith("}"):
             try:
-                data = json.loads(vt)
+                data = orjson.loads(vt)
                 if isinstance(data, dict):
                     return data
             except Exception:
@@ -645,7 +646,7 @@ def _format_volume_unit(value: Optional[float], unit: str) -> str:
         return f"{int(round(v))} mins"
     if v >= 1000:
         gb = v / 1000.0
-        return f"{int(gb)}GB" if abs(gb - int(gb)) < 1e-9 else f"{gb:.2f}GB"
+        return f"{int(gb)}GB" if gb.is_integer() else f"{gb:.2f}GB"
     return f"{int(v)}MB"
 
 def _value_text_for_display(value: Any, unit: str) -> str:
@@ -0,0 +1,26 @@
+import importlib
+import sys
+import types
+from unittest import mock
+
+import pytest
+
+
+@pytest.fixture()
+def import_with_fake_db():
+    """
+    Import app modules fresh against a MagicMock db.db. The modules bind their
+    collections at import time, so this keeps the tests off Atlas; sys.modules
+    is restored afterwards.
+    """
+    fake_db = types.ModuleType("db")
+    fake_db.db = mock.MagicMock()
+
+    def _import(*names):
+        for name in names:
+            sys.modules.pop(name, None)
+        mods = tuple(importlib.import_module(name) for name in names)
+        return mods[0] if len(mods) == 1 else mods
+
+    with mock.patch.dict(sys.modules, {"db": fake_db}):
+        yield _import
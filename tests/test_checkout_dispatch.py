@@ -0,0 +1,54 @@
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("bson")
+pytest.importorskip("requests")
+pytest.importorskip("orjson")
+
+
+@pytest.fixture()
+def checkout(import_with_fake_db):
+    return import_with_fake_db("checkout")
+
+
+def _store_page_job(service_id):
+    # Shape built by routes/store_page.py: service_id only, no svc_doc_snapshot
+    return {
+        "provider_request_order_id": "ORD1-1",
+        "phone": "0201234567",
+        "provider": "portal02",
+        "portal02_network_slug": "telecel",
+        "package_size_gb": 2,
+        "service_id": service_id,
+        "raw_item": {"phone": "0201234567", "value": 2},
+    }
+
+
+def test_store_page_job_resolves_service_slug(checkout):
+    services_col = mock.MagicMock()
+    services_col.find_one.return_value = {"_id": "svc1", "name": "Telecel Data", "network": "Telecel"}
+    send = mock.MagicMock(return_value=(True, {"reference": "REF1"}))
+
+    with mock.patch.object(checkout, "services_col", services_col), \
+         mock.patch.object(checkout, "_send_portal02_order", send):
+        line_ref, ok, *_ = checkout._dispatch_job("ORD1", _store_page_job("svc1"))
+
+    assert (line_ref, ok) == ("ORD1-1", True)
+    services_col.find_one.assert_called_once_with({"_id": "svc1"}, checkout.SERVICE_SNAPSHOT_PROJECTION)
+    assert send.call_args.kwargs["offer_slug"] == checkout.PORTAL02_OFFER_SLUG_TELECEL
+
+
+def test_snapshot_job_skips_service_query(checkout):
+    services_col = mock.MagicMock()
+    send = mock.MagicMock(return_value=(True, {}))
+    job = _store_page_job("svc1")
+    job["svc_doc_snapshot"] = {"name": "AT - iShare", "network": "AirtelTigo"}
+
+    with mock.patch.object(checkout, "services_col", services_col), \
+         mock.patch.object(checkout, "_send_portal02_order", send):
+        checkout._dispatch_job("ORD1", job)
+
+    services_col.find_one.assert_not_called()
+    assert send.call_args.kwargs["offer_slug"] == checkout.PORTAL02_OFFER_SLUG_ISHARE
@@ -0,0 +1,83 @@
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("bson")
+pytest.importorskip("orjson")
+
+
+class _ServicesCol:
+    """Just enough of a collection for _load_dashboard_services."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.reads = 0
+
+    def find(self, *args, **kwargs):
+        self.reads += 1
+        cursor = mock.MagicMock()
+        cursor.batch_size.return_value = iter([dict(d, offers=[dict(o) for o in d["offers"]]) for d in self.docs])
+        return cursor
+
+
+@pytest.fixture()
+def modules(import_with_fake_db):
+    return import_with_fake_db("customer_dashboard", "admin_services")
+
+
+@pytest.fixture()
+def dashboard(modules):
+    return modules[0]
+
+
+SERVICE_ID = "65a000000000000000000001"
+
+
+def _service(amount, status="OPEN"):
+    return {"_id": SERVICE_ID, "name": "MTN Data", "status": status, "availability": "AVAILABLE",
+            "offers": [{"value": "1GB", "amount": amount}]}
+
+
+def test_service_edit_is_visible_after_invalidation(dashboard):
+    col = _ServicesCol([_service(5.0)])
+    with mock.patch.object(dashboard, "services_col", col):
+        assert dashboard._load_dashboard_services()[0]["offers"][0]["amount"] == 5.0
+
+        # admin edits the price; without invalidation the TTL cache still serves the old row
+        col.docs = [_service(6.5)]
+        assert dashboard._load_dashboard_services()[0]["offers"][0]["amount"] == 5.0
+
+        dashboard.invalidate_dashboard_services()
+        assert dashboard._load_dashboard_services()[0]["offers"][0]["amount"] == 6.5
+    assert col.reads == 2
+
+
+def test_admin_status_toggle_reaches_dashboard_immediately(modules):
+    from flask import Flask
+
+    dashboard, admin_services = modules
+    col = _ServicesCol([_service(5.0)])
+
+    def update_one(flt, update):
+        col.docs = [dict(d, **update["$set"]) for d in col.docs]
+        return mock.MagicMock(matched_count=1)
+
+    admin_col = mock.MagicMock()
+    admin_col.update_one.side_effect = update_one
+
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.register_blueprint(admin_services.admin_services_bp)
+
+    with mock.patch.object(dashboard, "services_col", col), \
+         mock.patch.object(admin_services, "services_col", admin_col):
+        assert dashboard._load_dashboard_services()[0]["status"] == "OPEN"
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["role"] = "admin"
+        resp = client.post(f"/admin/services/{SERVICE_ID}/status", data={"status": "closed"})
+        assert resp.get_json()["success"] is True
+
+        assert dashboard._load_dashboard_services()[0]["status"] == "CLOSED"